@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""End-to-end pipeline benchmark on synthetic fields, without reeber or pressio.
+
+Each configuration runs run_pressio_pipeline.py --run_pressio on a generated
+clustered field (synthetic_field.py). fake_compressor.py stands in for pressio
+and fake_halo_exe.py for the halo exe. Stage times come from halo_trace. The
+results (evals/min, per-eval wall times and the per-stage breakdown) are saved
+as JSON under benchmarks/results/. Another results file can be given with
+--baseline to flag regressions.
+
+    python benchmarks/bench_pipeline.py --size 64 --size 128 --evals 4
+    python benchmarks/bench_pipeline.py --size 128 --config native="--halo_backend native" \
+        --baseline benchmarks/results/<earlier>.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+import halo_trace  # noqa: E402
+from synthetic_field import generate  # noqa: E402
+
+PIPELINE = os.path.join(REPO_DIR, "run_pressio_pipeline.py")
+DEFAULT_CONFIGS = {
+    "reeber_standin": "",
+    "native": "--halo_backend native",
+    "native_prescreen": "--halo_backend native --prescreen",
+}
+
+
+def parse_config(text):
+    name, _, flags = text.partition("=")
+    return name, flags
+
+
+def run_config(field, n, name, flags, rels, work_dir, warm_cache):
+    """Run one evaluation per rel; returns the result record for this (size, config)."""
+    tag = f"{n}_{name}"
+    trace_dir = os.path.join(work_dir, "traces", tag)
+    cache_dir = os.path.join(work_dir, "cache", tag)
+    shutil.rmtree(trace_dir, ignore_errors=True)
+    if not warm_cache:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    env = dict(os.environ, HALO_CACHE_DIR=cache_dir)
+    walls, failed = [], 0
+    for rel in rels:
+        cmd = [sys.executable, PIPELINE, "--run_pressio", "--transport", "compact", "--input", field,
+               "--dim", str(n), "--dim", str(n), "--dim", str(n), "--rel", repr(rel),
+               "--pressio", os.path.join(BENCH_DIR, "fake_compressor.py"),
+               "--halo_exe", os.path.join(BENCH_DIR, "fake_halo_exe.py"),
+               "--external_script", os.path.join(REPO_DIR, "halo_dual_pressio.py"),
+               "--workspace_root", os.path.join(work_dir, "workspaces"),
+               "--trace_dir", trace_dir, "--no_daemon"] + flags.split()
+        start = time.perf_counter()
+        result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+        walls.append(time.perf_counter() - start)
+        if result.returncode != 0 or "external:api=json:1" not in result.stdout:
+            failed += 1
+            print(f"[bench] {tag} rel={rel:g} failed:\n{result.stderr[-1500:]}", file=sys.stderr)
+        print(f"[bench] {tag} rel={rel:g} {walls[-1]:.2f}s", file=sys.stderr)
+    shutil.rmtree(os.path.join(work_dir, "workspaces"), ignore_errors=True)
+    records = halo_trace.load_traces([trace_dir]) if os.path.isdir(trace_dir) else []
+    return {
+        "size": n, "config": name, "flags": flags, "evals": len(rels), "failed": failed,
+        "wall_s": walls, "wall_mean_s": float(np.mean(walls)),
+        "evals_per_min": 60.0 * len(walls) / sum(walls),
+        "stages": halo_trace.summarize(records) if records else [],
+    }
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "-C", REPO_DIR, "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(runs, baseline_path, tolerance):
+    """Print evals/min against a baseline results file; returns the regressed (size, config) pairs."""
+    with open(baseline_path) as f:
+        base = {(r["size"], r["config"]): r for r in json.load(f)["runs"]}
+    regressed = []
+    for r in runs:
+        b = base.get((r["size"], r["config"]))
+        if b is None:
+            continue
+        ratio = r["evals_per_min"] / b["evals_per_min"]
+        flag = "REGRESSION" if ratio < 1.0 - tolerance else "ok"
+        print(f"{r['size']:>6}  {r['config']:<20}{b['evals_per_min']:>10.2f}{r['evals_per_min']:>10.2f}"
+              f"{ratio:>8.2f}x  {flag}")
+        if flag != "ok":
+            regressed.append((r["size"], r["config"]))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="End-to-end pipeline benchmark on synthetic fields")
+    parser.add_argument("--size", type=int, action="append", help="Field size per side (repeatable, default 64)")
+    parser.add_argument("--config", type=parse_config, action="append",
+                        help="name=\"pipeline flags\" (repeatable; default: reeber_standin, native, native_prescreen)")
+    parser.add_argument("--evals", type=int, default=4, help="Evaluations per configuration")
+    parser.add_argument("--rel_range", type=float, nargs=2, default=[1e-5, 1e-2], metavar=("LO", "HI"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--work_dir", default=os.path.join(BENCH_DIR, ".work"),
+                        help="Generated fields, caches and traces (fields are reused across runs)")
+    parser.add_argument("--warm_cache", action="store_true", help="Keep the halo cache between benchmark runs")
+    parser.add_argument("--out", help="Results JSON (default: benchmarks/results/bench_<utc time>.json)")
+    parser.add_argument("--baseline", help="Earlier results JSON to compare evals/min against")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed evals/min drop vs. the baseline")
+    args = parser.parse_args()
+
+    sizes = args.size or [64]
+    configs = dict(args.config) if args.config else DEFAULT_CONFIGS
+    rels = [float(r) for r in np.geomspace(args.rel_range[0], args.rel_range[1], args.evals)]
+    os.makedirs(args.work_dir, exist_ok=True)
+
+    runs = []
+    for n in sizes:
+        field = os.path.join(args.work_dir, f"field_{n}_s{args.seed}.f32")
+        if not os.path.exists(field):
+            start = time.perf_counter()
+            generate(field, n, seed=args.seed)
+            print(f"[bench] generated {field} in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+        for name, flags in configs.items():
+            runs.append(run_config(field, n, name, flags, rels, args.work_dir, args.warm_cache))
+
+    stamp = datetime.datetime.now(datetime.timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    results = {
+        "meta": {"time": stamp, "git_rev": _git_rev(), "python": platform.python_version(),
+                 "numpy": np.__version__, "platform": platform.platform(), "cpu_count": os.cpu_count(),
+                 "evals": args.evals, "rel_range": args.rel_range, "seed": args.seed},
+        "runs": runs,
+    }
+    out = args.out or os.path.join(BENCH_DIR, "results", f"bench_{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'size':>6}  {'config':<20}{'evals/min':>10}{'mean s':>10}{'failed':>8}")
+    for r in runs:
+        print(f"{r['size']:>6}  {r['config']:<20}{r['evals_per_min']:>10.2f}{r['wall_mean_s']:>10.2f}{r['failed']:>8}")
+    print(f"results: {out}")
+    if args.baseline:
+        print(f"{'size':>6}  {'config':<20}{'base':>10}{'now':>10}{'ratio':>9}")
+        if compare(runs, args.baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
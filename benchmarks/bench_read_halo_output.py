@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""Benchmark: vectorized read_halo_output vs. the original per-line dict parser.
+
+    python benchmarks/bench_read_halo_output.py --halos 1000000 --malformed 0.001
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from halo_dual_pressio import read_halo_output  # noqa: E402
+
+
+def read_halo_output_legacy(filename: str) -> pd.DataFrame:
+    """The pre-vectorization implementation, kept verbatim for comparison."""
+    rows = []
+    with open(filename, "r") as f:
+        for line in f:
+            parts = line.strip().split()
+            if len(parts) < 7:
+                continue
+            id_, x, y, z, n_cell, n_vert, mass, *extra = parts
+            try:
+                rows.append({
+                    "id": int(id_),
+                    "x": int(x),
+                    "y": int(y),
+                    "z": int(z),
+                    "n_cell": int(n_cell),
+                    "n_vert": int(n_vert),
+                    "mass": float(mass),
+                })
+            except ValueError:
+                continue
+    return pd.DataFrame(rows)
+
+
+def write_catalog(path, n, malformed, seed=0):
+    rng = np.random.default_rng(seed)
+    ids = rng.integers(0, 1 << 40, n)
+    xyz = rng.integers(0, 1024, (n, 3))
+    n_cell = rng.integers(1, 5000, n)
+    mass = rng.lognormal(8, 2, n)
+    bad = rng.random(n) < malformed
+    with open(path, "w") as f:
+        for i in range(n):
+            if bad[i]:
+                f.write("garbage 1 2\n" if i % 2 else f"{ids[i]} 1.5 2 3 4 5 6\n")
+                continue
+            f.write(f"{ids[i]} {xyz[i, 0]} {xyz[i, 1]} {xyz[i, 2]} {n_cell[i]} {n_cell[i]} {mass[i]:.6e} 0 0\n")
+
+
+def measure(fn, *args, **kwargs):
+    """(result, seconds, peak traced bytes); timed without tracemalloc, which slows Python-level code."""
+    t0 = time.perf_counter()
+    out = fn(*args, **kwargs)
+    elapsed = time.perf_counter() - t0
+    tracemalloc.start()
+    fn(*args, **kwargs)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return out, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--halos", type=int, default=200000)
+    parser.add_argument("--malformed", type=float, default=0.001, help="Fraction of malformed lines")
+    parser.add_argument("--chunk_lines", type=int, default=1 << 16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "halos.txt")
+        write_catalog(path, args.halos, args.malformed)
+        legacy, t_legacy, m_legacy = measure(read_halo_output_legacy, path)
+        whole, t_whole, m_whole = measure(read_halo_output, path, chunk_lines=None)
+        chunked, t_chunk, m_chunk = measure(read_halo_output, path, chunk_lines=args.chunk_lines)
+
+    for df in (whole, chunked):
+        pd.testing.assert_frame_equal(df, legacy, check_dtype=False)
+    print(f"halos={args.halos} kept={len(legacy)}")
+    print(f"{'impl':<20}{'seconds':>10}{'peak MiB':>12}{'speedup':>10}")
+    for name, t, m in (("legacy", t_legacy, m_legacy), ("vectorized", t_whole, m_whole),
+                       (f"chunked({args.chunk_lines})", t_chunk, m_chunk)):
+        print(f"{name:<20}{t:>10.3f}{m / 2**20:>12.1f}{t_legacy / t:>10.1f}x")
+
+
+if __name__ == "__main__":
+    main()
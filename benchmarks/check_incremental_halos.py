@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""Check incremental_halos against a full native_halo_finder run of the decompressed field.
+
+Each case perturbs a copy of an original field (threshold flips only, all
+other cells unchanged), so the spliced catalog must equal the full catalog
+exactly. The first case is a halo crossing an inner-box boundary with its
+peak outside the dirty block; the others flip random cells of a synthetic
+clustered field (synthetic_field.py), including cells at the field edge.
+
+    python benchmarks/check_incremental_halos.py
+    python benchmarks/check_incremental_halos.py --size 128 --trials 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+from check_native_halo_finder import compare  # noqa: E402
+from incremental_halos import incremental_catalog  # noqa: E402
+from native_halo_finder import DEFAULT_RHO, find_halos  # noqa: E402
+from synthetic_field import generate  # noqa: E402
+
+
+def check(orig, dec, d, name, block, margin):
+    """'' if incremental_catalog(orig -> dec) equals a full run on dec, else why not."""
+    dims = list(reversed(orig.shape))
+    po, pd_ = os.path.join(d, f"{name}_orig.f32"), os.path.join(d, f"{name}_dec.f32")
+    orig.astype("<f4").tofile(po)
+    dec.astype("<f4").tofile(pd_)
+    df, info = incremental_catalog(find_halos(po, dims), po, pd_, dims, block=block, margin=margin,
+                                   max_fraction=1.0)
+    if df is None:
+        return f"fell back to the full run ({info})"
+    return compare(df, find_halos(pd_, dims))
+
+
+def boundary_case(d):
+    """A line of 1000s with its peak at x=10; the decompressed field extends it by one cell at x=41."""
+    a = np.ones((128, 128, 128), dtype=np.float32)
+    a[50, 50, 10:41] = 1000.0
+    a[50, 50, 10] = 5000.0
+    b = a.copy()
+    b[50, 50, 41] = 1000.0
+    return check(a, b, d, "boundary", block=16, margin=16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=64, help="Side of the generated field")
+    parser.add_argument("--trials", type=int, default=6)
+    parser.add_argument("--flips", type=int, default=3, help="Cells flipped per trial")
+    parser.add_argument("--block", type=int, default=16)
+    parser.add_argument("--margin", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as d:
+        why = boundary_case(d)
+        failed += bool(why)
+        print(f"{'boundary':<12} {why or 'ok'}")
+        path = os.path.join(d, "field.f32")
+        generate(path, args.size, seed=args.seed)
+        a = np.fromfile(path, dtype="<f4").reshape((args.size,) * 3)
+        thr = DEFAULT_RHO * a.mean(dtype=np.float64)
+        rng = np.random.default_rng(args.seed)
+        for t in range(args.trials):
+            b = a.copy()
+            cells = rng.integers(0, args.size, (args.flips, 3))
+            cells[0, t % 3] = 0 if t % 2 else args.size - 1  # one flip on the field edge
+            for z, y, x in cells:
+                b[z, y, x] = thr * 0.5 if b[z, y, x] > thr else thr * 1.5
+            why = check(a, b, d, f"trial{t}", args.block, args.margin)
+            failed += bool(why)
+            print(f"{f'trial {t}':<12} {why or 'ok'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
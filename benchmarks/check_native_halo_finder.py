@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""Check native_halo_finder against a whole-array scipy.ndimage.label reference.
+
+The reference labels the full field at once (periodic wrap: labels that
+touch across opposite faces are joined) and reduces it to the same catalog.
+The blocked finder must match it exactly for every block size, with and
+without wrap: same ids, positions and cell counts, and masses to rounding.
+By default a synthetic clustered field is generated (synthetic_field.py).
+
+    python benchmarks/check_native_halo_finder.py --size 96 --block 16 --block 40 --block 128
+    python benchmarks/check_native_halo_finder.py --input field.f32 --dim 128 --dim 128 --dim 128
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+from native_halo_finder import CATALOG_COLUMNS, DEFAULT_RHO, find_halos  # noqa: E402
+from synthetic_field import generate  # noqa: E402
+
+
+def reference_halos(data, threshold, wrap=True):
+    """Catalog of the face-connected components of {data > threshold}, labeled in one piece."""
+    labels, n = ndimage.label(data > threshold)
+    if n == 0:
+        return pd.DataFrame({c: np.empty(0, dtype=np.float64 if c == "mass" else np.int64) for c in CATALOG_COLUMNS})
+    comp = np.arange(n + 1)
+    if wrap:
+        a, b = [], []
+        for axis in range(3):
+            lo, hi = np.take(labels, 0, axis=axis), np.take(labels, -1, axis=axis)
+            touch = (lo > 0) & (hi > 0)
+            a.append(lo[touch])
+            b.append(hi[touch])
+        a, b = np.concatenate(a), np.concatenate(b)
+        graph = coo_matrix((np.ones(len(a), dtype=np.int8), (a, b)), shape=(n + 1, n + 1))
+        _, comp = connected_components(graph, directed=False)
+    flat = labels.ravel()
+    sel = np.flatnonzero(flat)
+    halo = np.unique(comp[1:], return_inverse=True)[1][flat[sel] - 1]
+    vals = data.ravel()[sel]
+    order = np.lexsort((vals, halo))
+    best = sel[order[np.r_[np.flatnonzero(np.diff(halo[order])), len(order) - 1]]]
+    z, y, x = np.unravel_index(best, data.shape)
+    n_cell = np.bincount(halo).astype(np.int64)
+    return pd.DataFrame({"id": best.astype(np.int64), "x": x.astype(np.int64), "y": y.astype(np.int64),
+                         "z": z.astype(np.int64), "n_cell": n_cell, "n_vert": n_cell,
+                         "mass": np.bincount(halo, weights=vals.astype(np.float64))})
+
+
+def compare(found, ref):
+    """Empty string if the catalogs agree (ids, positions, counts exact; masses to rounding), else why not."""
+    if len(found) != len(ref):
+        return f"{len(found)} halos vs {len(ref)} in the reference"
+    found = found.sort_values("id").reset_index(drop=True)
+    ref = ref.sort_values("id").reset_index(drop=True)
+    exact = [c for c in CATALOG_COLUMNS if c != "mass"]
+    bad = (found[exact].to_numpy() != ref[exact].to_numpy()).any(axis=1)
+    if bad.any():
+        return f"{int(bad.sum())} halos differ in {exact}"
+    if not np.allclose(found["mass"], ref["mass"], rtol=1e-9, atol=0.0):
+        return f"max mass rel. error {np.max(np.abs(found['mass'] / ref['mass'] - 1)):.3g}"
+    return ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--input", help="Raw float32 field (default: generate one)")
+    parser.add_argument("--dim", type=int, action="append", help="Dims of --input, x fastest")
+    parser.add_argument("--size", type=int, default=64, help="Side of the generated field")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--block", type=int, action="append", help="Block sizes to check (default: 16, 24, 64)")
+    parser.add_argument("--rho", type=float, default=DEFAULT_RHO)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        path, dims = args.input, args.dim
+        if path is None:
+            path, dims = os.path.join(d, "field.f32"), [args.size] * 3
+            generate(path, args.size, seed=args.seed)
+        elif not dims or len(dims) != 3:
+            parser.error("--input needs three --dim")
+        data = np.fromfile(path, dtype="<f4").reshape(tuple(reversed(dims)))
+        threshold = args.rho * data.sum(dtype=np.float64) / data.size
+        failed = 0
+        for wrap in (True, False):
+            ref = reference_halos(data, threshold, wrap)
+            for block in args.block or [16, 24, 64]:
+                why = compare(find_halos(path, dims, rho=args.rho, block=block, wrap=wrap), ref)
+                failed += bool(why)
+                print(f"wrap={wrap!s:<5} block={block:<5} halos={len(ref):<7} {why or 'ok'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
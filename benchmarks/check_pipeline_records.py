@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Check the libpressio records run_pressio_pipeline.py emits, for both transports.
+
+Runs the pipeline on a generated field with fake_compressor.py and the
+native backend (no pressio or reeber needed) and checks:
+
+    reject   a prescreen reject (--prescreen_max_flip_fraction 0 at a large
+             rel) is marked prescreen="reject" with null metrics, never as
+             empty arrays, which libpressio consumers read as "no error"
+    full     a normal evaluation has finite metrics (compact) or non-empty
+             arrays (json)
+
+    python benchmarks/check_pipeline_records.py --size 64
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCH_DIR)
+from halo_metrics import ARRAY_NAMES, SUMMARY_KEYS  # noqa: E402
+from synthetic_field import generate  # noqa: E402
+
+PIPELINE = os.path.join(REPO_DIR, "run_pressio_pipeline.py")
+CASES = {
+    "reject": ["--rel", "0.5", "--prescreen", "--prescreen_max_flip_fraction", "0"],
+    "full": ["--rel", "1e-4"],
+}
+
+
+def run(field, n, transport, flags, work_dir):
+    """The JSON record after external:api=json:1, or None (with the stderr tail printed) on failure."""
+    cmd = [sys.executable, PIPELINE, "--run_pressio", "--transport", transport, "--input", field,
+           "--dim", str(n), "--dim", str(n), "--dim", str(n), "--halo_backend", "native",
+           "--pressio", os.path.join(BENCH_DIR, "fake_compressor.py"),
+           "--external_script", os.path.join(REPO_DIR, "halo_dual_pressio.py"),
+           "--workspace_root", os.path.join(work_dir, "workspaces"), "--no_daemon"] + flags
+    env = dict(os.environ, HALO_CACHE_DIR=os.path.join(work_dir, "cache"))
+    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    lines = result.stdout.splitlines()
+    for i, line in enumerate(lines[:-1]):
+        if line.strip() == "external:api=json:1":
+            return json.loads(lines[i + 1])
+    print(result.stderr[-1500:], file=sys.stderr)
+    return None
+
+
+def check(case, transport, rec):
+    """Empty string if rec is right for the case, else why not."""
+    if rec is None:
+        return "no record"
+    if case == "reject":
+        if rec.get("prescreen") != "reject":
+            return f"prescreen={rec.get('prescreen')!r}"
+        keys = SUMMARY_KEYS + (ARRAY_NAMES if transport == "json" else [])
+        bad = [k for k in keys if k not in rec or rec[k] is not None]
+        return f"not null: {bad}" if bad else ""
+    if transport == "json":
+        bad = [k for k in ARRAY_NAMES if not rec.get(k)]
+        return f"empty arrays: {bad}" if bad else ""
+    bad = [k for k in SUMMARY_KEYS if rec.get(k) is None]
+    return f"null metrics: {bad}" if bad else ""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=64, help="Side of the generated field")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failed = 0
+    with tempfile.TemporaryDirectory() as d:
+        field = os.path.join(d, "field.f32")
+        generate(field, args.size, seed=args.seed)
+        for case, flags in CASES.items():
+            for transport in ("json", "compact"):
+                why = check(case, transport, run(field, args.size, transport, flags, d))
+                failed += bool(why)
+                print(f"{case:<8} {transport:<8} {why or 'ok'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
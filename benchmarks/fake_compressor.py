@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Stand-in for `pressio` in benchmarks: bounded noise instead of a real compressor.
+
+Accepts the command line run_pressio_pipeline.py builds (-i, -d, -b
+compressor=, -o rel=, -o external:command=..., the rest is ignored). The
+"decompressed" field is the input plus uniform noise in [-rel, rel] x value
+range, the same error bound SZ's rel mode guarantees. It is written slab by
+slab to a temp file. Then the external command is run the way libpressio
+runs it (--input/--decompressed/--dim appended), and its output is passed
+through after a modelled size:compression_ratio line.
+"""
+import math
+import os
+import shlex
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from field_io import iter_slabs  # noqa: E402
+
+
+def _values(argv, flag):
+    return [argv[i + 1] for i, a in enumerate(argv[:-1]) if a == flag]
+
+
+def _option(options, name):
+    for opt in options:
+        if opt.startswith(name + "="):
+            return opt[len(name) + 1:]
+    return None
+
+
+def compression_ratio(rel):
+    """Rough SZ-like model: bits per value ~ log2 of the number of quantization bins, plus one."""
+    return 32.0 / max(1.0, math.log2(1.0 / (2.0 * rel)) + 1.0)
+
+
+def add_noise(inp, out, dims, rel, seed=0):
+    lo, hi = np.inf, -np.inf
+    for _, tile in iter_slabs(inp, dims):
+        lo, hi = min(lo, float(tile.min())), max(hi, float(tile.max()))
+    bound = rel * (hi - lo)
+    rng = np.random.default_rng(seed)
+    with open(out, "wb") as f:
+        for _, tile in iter_slabs(inp, dims):
+            (tile + rng.uniform(-bound, bound, tile.shape).astype(np.float32)).tofile(f)
+
+
+def main():
+    argv = sys.argv[1:]
+    inp = _values(argv, "-i")[0]
+    dims = [int(d) for d in _values(argv, "-d")]
+    options = _values(argv, "-o")
+    rel = float(_option(options, "rel"))
+    command = _option(options, "external:command")
+
+    fd, dec = tempfile.mkstemp(suffix=".f32")
+    os.close(fd)
+    try:
+        start = time.perf_counter()
+        add_noise(inp, dec, dims, rel, seed=int(abs(math.log10(rel)) * 1000) if rel > 0 else 0)
+        print(f"[fake_compressor] noise rel={rel:g} in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+        returncode, stdout = 0, ""
+        if command:
+            cmd = shlex.split(command) + ["--input", inp, "--decompressed", dec]
+            for d in dims:
+                cmd += ["--dim", str(d)]
+            result = subprocess.run(cmd, capture_output=True, text=True)
+            sys.stderr.write(result.stderr)
+            returncode, stdout = result.returncode, result.stdout
+    finally:
+        os.remove(dec)
+    print(f"size:compression_ratio <double> = {compression_ratio(rel):.6f}")
+    sys.stdout.write(stdout)
+    sys.exit(returncode)
+
+
+if __name__ == "__main__":
+    main()
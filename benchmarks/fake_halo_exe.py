@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Stand-in for reeber's amr_connected_components_float in benchmarks.
+
+Same command line as the real exe (`-b 128 -n -w -f <field> in.h5 none none
+out.txt`). It labels with native_halo_finder and writes the text catalog
+(id x y z n_cell n_vert mass per line) that halo_dual_pressio parses. Either
+HDF5 layout works: an external dataset (h5_mode external) is read straight
+from its raw file, and a regular dataset (h5_mode copy) is first streamed to
+a temp raw file.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import h5py
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from native_halo_finder import find_halos  # noqa: E402
+
+
+def raw_source(h5_path, field):
+    """(raw float32 path, dims x-fastest, temp path to delete or None) for the field in h5_path."""
+    with h5py.File(h5_path, "r") as f:
+        ds = f[field]
+        dims = list(reversed(ds.shape))
+        external = ds.external
+        if external and len(external) == 1 and external[0][1] == 0:
+            path = external[0][0]
+            return path.decode() if isinstance(path, bytes) else path, dims, None
+        fd, tmp = tempfile.mkstemp(suffix=".f32")
+        with os.fdopen(fd, "wb") as out:
+            for z in range(ds.shape[0]):
+                out.write(np.ascontiguousarray(ds[z], dtype="<f4").tobytes())
+        return tmp, dims, tmp
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in halo finder (reeber command line)")
+    parser.add_argument("-b", type=int, default=128, help="Block size")
+    parser.add_argument("-n", action="store_true", help="Threshold relative to the mean (always on here)")
+    parser.add_argument("-w", action="store_true", help="Periodic wrap")
+    parser.add_argument("-f", required=True, help="Dataset path inside the HDF5 file")
+    parser.add_argument("input")
+    parser.add_argument("unused", nargs=2)
+    parser.add_argument("output")
+    args = parser.parse_args()
+
+    path, dims, tmp = raw_source(args.input, args.f)
+    try:
+        df = find_halos(path, dims, block=args.b, wrap=args.w,
+                        workers=int(os.environ.get("OMP_NUM_THREADS", "0")) or None)
+    finally:
+        if tmp:
+            os.remove(tmp)
+    cols = ["id", "x", "y", "z", "n_cell", "n_vert", "mass"]
+    np.savetxt(args.output, df[cols].to_numpy(dtype=np.float64), fmt=["%d"] * 6 + ["%.9g"])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 import pandas as pd
 import numpy as np
 from scipy.stats import wasserstein_distance
-from sklearn.neighbors import NearestNeighbors
+
+from halo_matching import nearest
 
 
 
@@ -20,11 +21,7 @@ mass_decomp = df_merged['mass_decomp'].values
 orig_xyz = df_original[['x','y','z']].values
 dec_xyz  = df_decompressed[['x','y','z']].values
 
-nn = NearestNeighbors(n_neighbors=1, algorithm='kd_tree').fit(dec_xyz)
-distances, indices = nn.kneighbors(orig_xyz)
-
-
-distances = distances.flatten()
+distances, indices = nearest(orig_xyz, dec_xyz)
 
 print("Nearest Neighbor Distance Stats:")
 print(f"Mean:  {np.mean(distances):.4f}")
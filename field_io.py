@@ -0,0 +1,80 @@
+"""Out-of-core access to raw float32 fields.
+
+A 2048^3 snapshot is 32 GB, more than a node can hold twice. Fields are
+opened with np.memmap and walked in tiles of whole x rows whose z depth is
+the halo finder's block size (a multiple of it when the budget allows). Each
+tile is mapped, copied out and unmapped again, so resident memory stays near
+the tile size whatever the field size:
+
+    for (z0, z1, y0, y1), tile in iter_slabs(path, dims, block=128, max_memory_mb=1024):
+        ...
+"""
+import os
+
+import numpy as np
+
+FIELD_DTYPE = np.dtype("<f4")
+
+
+def default_max_memory_mb():
+    """HALO_MAX_MEMORY_MB as set now (a halo_daemon child only gets its client's env after import)."""
+    return int(os.environ.get("HALO_MAX_MEMORY_MB", "1024"))
+
+
+DEFAULT_MAX_MEMORY_MB = default_max_memory_mb()
+
+
+def field_shape(dims):
+    """dims are fastest-varying first (x, y, z); arrays are (z, y, x)."""
+    return tuple(int(d) for d in reversed(dims))
+
+
+def tile_shape(shape, block, max_bytes):
+    """(depth, rows) of the tiles iter_slabs yields: depth z planes x rows y rows x all of x."""
+    row = shape[2] * FIELD_DTYPE.itemsize
+    budget_rows = max(1, int(max_bytes // row))
+    bz = min(block, shape[0])
+    if budget_rows >= bz * shape[1]:  # whole planes, block-aligned depth
+        depth = budget_rows // shape[1]
+        return min(depth - depth % bz, shape[0]), shape[1]
+    if budget_rows >= bz:  # one block deep, as many block-aligned rows as fit
+        rows = budget_rows // bz
+        return bz, min(rows - rows % block if rows >= block else rows, shape[1])
+    return 1, min(budget_rows, shape[1])  # budget below one block column: plain rows
+
+
+def iter_slabs(path, dims, block=128, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+    """Yield ((z0, z1, y0, y1), tile) over the whole field; tile is an in-memory copy.
+
+    A tile is at most a quarter of max_memory_mb, leaving room for the mapped
+    pages being copied and for the consumer (e.g. the HDF5 chunk cache).
+    """
+    shape = field_shape(dims)
+    depth, rows = tile_shape(shape, block, max_memory_mb * 2 ** 20 // 4)
+    row = shape[2] * FIELD_DTYPE.itemsize
+    for z0 in range(0, shape[0], depth):
+        z1 = min(z0 + depth, shape[0])
+        for y0 in range(0, shape[1], rows):
+            y1 = min(y0 + rows, shape[1])
+            tile = np.empty((z1 - z0, y1 - y0, shape[2]), dtype=FIELD_DTYPE)
+            for z in range(z0, z1):
+                # map only this plane's contiguous rows: a strided view into one big mapping
+                # faults in whole page-cache folios around every row
+                mm = np.memmap(path, dtype=FIELD_DTYPE, mode="r", offset=(z * shape[1] + y0) * row,
+                               shape=tile.shape[1:])
+                tile[z - z0] = mm
+                del mm  # unmap: drop the file pages from our resident set
+            yield (z0, z1, y0, y1), tile
+
+
+def copy_to_dataset(path, dims, group, name, block=128, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+    """Stream a raw field into a new h5py dataset group[name] with block^3 chunks, tile by tile.
+
+    Open the file with rdcc_nbytes of about max_memory_mb / 4 so partly written
+    chunks stay cached instead of being flushed and re-read.
+    """
+    shape = field_shape(dims)
+    ds = group.create_dataset(name, shape=shape, dtype=FIELD_DTYPE, chunks=tuple(min(block, n) for n in shape))
+    for (z0, z1, y0, y1), tile in iter_slabs(path, dims, block, max_memory_mb):
+        ds[z0:z1, y0:y1] = tile
+    return ds
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""Evaluate many (original, decompressed, field, dims) entries in one process.
+
+Per-entry runs of halo_dual_pressio.py pay for interpreter startup, the heavy
+imports, a fresh halo cache lookup and a fresh process pool every time. Here
+one process evaluates a whole manifest:
+- one HaloCache and, for the native backend, one process pool are shared
+  by all entries;
+- while entry i runs the halo analysis, a background thread prepares entry
+  i+1. It hashes the original (the cache key) and asks the kernel to read
+  ahead the decompressed field (and the original on a cache miss);
+- results go to one columnar table with one row per entry (Parquet when
+  pyarrow is installed, CSV otherwise). --halo_table adds a table with one
+  row per matched halo, replacing the per-run .npy files.
+
+Manifest: JSONL or CSV with columns original, decompressed, dims
+("512x512x512", "512,512,512" or a JSON list), and optionally name and field
+(HDF5 dataset path for the reeber exe, default native_fields/baryon_density).
+Any other columns (timestep, compressor, rel, ...) are copied to the results.
+
+    python halo_batch.py --manifest runs.jsonl --out results.parquet --halo_backend native
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+import numpy as np
+import pandas as pd
+
+import halo_dual_pressio as hdp
+import halo_trace
+import native_halo_finder
+from field_io import default_max_memory_mb
+from halo_cache import HaloCache
+from halo_metrics import SUMMARY_KEYS, summarize
+from halo_trace import stage
+from prescreen import DEFAULT_MAX_ERROR, DEFAULT_MAX_FLIP_FRACTION, decide, field_stats
+
+ENTRY_COLUMNS = ["name", "original", "decompressed", "field", "dims"]
+WARM_CHUNK = 16 * 1024 * 1024
+
+
+def parse_dims(value):
+    if isinstance(value, (list, tuple)):
+        return [int(d) for d in value]
+    text = str(value).strip()
+    if text.startswith("["):
+        return [int(d) for d in json.loads(text)]
+    return [int(d) for d in text.replace("x", ",").split(",") if d.strip()]
+
+
+def load_manifest(path):
+    """Manifest entries as dicts with ENTRY_COLUMNS filled in (relative paths resolved against the manifest)."""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, newline="") as f:
+        if path.endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    entries = []
+    for i, row in enumerate(rows):
+        missing = [k for k in ("original", "decompressed", "dims") if not row.get(k)]
+        if missing:
+            raise ValueError(f"{path}: entry {i} lacks {', '.join(missing)}")
+        entry = dict(row)
+        for k in ("original", "decompressed"):
+            entry[k] = os.path.join(base, row[k])
+        entry["dims"] = parse_dims(row["dims"])
+        entry["field"] = row.get("field") or hdp.HALO_FIELD
+        entry["name"] = row.get("name") or f"entry_{i}"
+        entries.append(entry)
+    return entries
+
+
+def warm_file(path):
+    """Start kernel read-ahead of a whole file (falls back to reading it through)."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        else:
+            while os.read(fd, WARM_CHUNK):
+                pass
+    finally:
+        os.close(fd)
+
+
+def prefetch(entry, cache, exe_path, backend):
+    """I/O for an upcoming entry: hash the original (memoized cache key), warm what the analysis will read."""
+    with stage("prefetch", children=False, entry=entry["name"]) as trace:
+        hit = False
+        if cache is not None:
+            _, flags_for = hdp.HALO_BACKENDS[backend]
+            key = cache.key(entry["original"], entry["dims"], exe_path if backend == "reeber" else None,
+                            flags_for(entry["field"]))
+            hit = key in cache
+        trace["cache"] = "hit" if hit else "miss"
+        if not hit:
+            warm_file(entry["original"])
+        warm_file(entry["decompressed"])
+
+
+def size_ok(entry):
+    expected = int(np.prod(entry["dims"])) * 4
+    return all(os.path.exists(entry[k]) and os.path.getsize(entry[k]) == expected
+               for k in ("original", "decompressed"))
+
+
+def entry_row(entry):
+    """Result row seeded with every manifest column, dims written as 512x512x512."""
+    row = {k: entry[k] for k in entry if k != "dims"}
+    row["dims"] = "x".join(str(d) for d in entry["dims"])
+    return row
+
+
+def evaluate_entry(entry, index, args, cache, batch_uuid):
+    """(result row, per-halo DataFrame or None) for one manifest entry."""
+    row = entry_row(entry)
+    if not size_ok(entry):
+        row["status"] = "skipped: size mismatch"
+        return row, None
+    dims, eval_uuid = entry["dims"], f"{batch_uuid}_{index}"
+    halo_kwargs = {"h5_mode": args.h5_mode, "workdir": args.workdir, "backend": args.halo_backend,
+                   "max_memory_mb": args.max_memory_mb, "field": entry["field"]}
+    decision = "full"
+    if args.prescreen:
+        with stage("prescreen", entry=entry["name"]) as trace:
+            stats = field_stats(entry["original"], entry["decompressed"], dims, native_halo_finder.DEFAULT_RHO,
+                                hdp.HALO_BLOCK, args.max_memory_mb)
+            decision, reason = decide(stats, args.prescreen_max_flip_fraction, args.prescreen_max_error)
+            trace["decision"] = decision
+        row.update(prescreen=decision, prescreen_reason=reason, prescreen_flip_fraction=stats["flip_fraction"],
+                   prescreen_max_error_above=stats["max_error_above"])
+        if decision == "reject":
+            row.update({k: None for k in SUMMARY_KEYS}, status="rejected")
+            return row, None
+
+    tmp = []
+    try:
+        if decision == "exact":
+            df_orig, t1 = hdp.run_halo_analysis(entry["original"], dims, args.external_exe, "original", eval_uuid,
+                                                cache=cache, **halo_kwargs)
+            df_dec, t2 = df_orig.copy(), []
+        elif args.parallel:
+            (df_orig, t1), (df_dec, t2) = hdp.run_halo_pair([
+                ((entry["original"], dims, args.external_exe, "original", eval_uuid), dict(halo_kwargs, cache=cache)),
+                ((entry["decompressed"], dims, args.external_exe, "decompressed", eval_uuid), halo_kwargs),
+            ], args.threads_per_job)
+        else:
+            df_orig, t1 = hdp.run_halo_analysis(entry["original"], dims, args.external_exe, "original", eval_uuid,
+                                                cache=cache, **halo_kwargs)
+            df_dec, t2 = hdp.run_halo_analysis(entry["decompressed"], dims, args.external_exe, "decompressed",
+                                               eval_uuid, **halo_kwargs)
+        tmp.extend(t1 + t2)
+        dists, mass_orig, mass_dec = hdp.compute_metrics(df_orig, df_dec, dims, periodic=args.periodic,
+                                                         mutual=args.mutual_match, workers=args.match_workers)
+        dists_rev = hdp.compute_reverse_dists(df_orig, df_dec, dims, periodic=args.periodic,
+                                              workers=args.match_workers)
+    finally:
+        hdp.cleanup(tmp)
+    row.update(summarize(dists, mass_orig, mass_dec, dists_rev))
+    row.update(n_halos_orig=len(df_orig), n_halos_dec=len(df_dec), n_matched=len(dists),
+               total_mass_orig=float(df_orig["mass"].sum()), total_mass_dec=float(df_dec["mass"].sum()),
+               status="ok")
+    halos = None
+    if args.halo_table:
+        halos = pd.DataFrame({"name": entry["name"], "dist": dists, "mass_orig": mass_orig, "mass_dec": mass_dec})
+    return row, halos
+
+
+def table_format(fmt, path):
+    """'parquet' or 'csv' for fmt ('auto': Parquet when path ends in .parquet and pyarrow is importable).
+
+    Resolved before any entry runs, so a missing pyarrow cannot lose a finished batch.
+    """
+    if fmt == "csv" or (fmt == "auto" and not path.endswith(".parquet")):
+        return "csv"
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        if fmt == "parquet":
+            raise
+        return "csv"
+    return "parquet"
+
+
+def write_table(df, path, fmt):
+    """Write df as fmt (see table_format); a .parquet path written as CSV becomes .csv."""
+    if fmt == "parquet":
+        df.to_parquet(path, index=False)
+        return path
+    if path.endswith(".parquet"):
+        path = path[: -len(".parquet")] + ".csv"
+        print(f"[batch] pyarrow not installed, writing CSV: {path}", file=sys.stderr)
+    tmp = f"{path}.tmp"
+    df.to_csv(tmp, index=False)
+    os.replace(tmp, path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch halo evaluation over a manifest")
+    parser.add_argument("--manifest", required=True, help="JSONL or CSV of original/decompressed/field/dims entries")
+    parser.add_argument("--out", default="batch_results.parquet", help="Results table (one row per entry)")
+    parser.add_argument("--halo_table", help="Optional per-halo table (entry name, dist, mass_orig, mass_dec)")
+    parser.add_argument("--format", choices=["auto", "parquet", "csv"], default="auto")
+    parser.add_argument("--external_exe", help="reeber amr_connected_components_float (required for --halo_backend reeber)")
+    parser.add_argument("--halo_backend", choices=sorted(hdp.HALO_BACKENDS), default="reeber")
+    parser.add_argument("--workdir", default=".", help="Scratch directory for HDF5 wrappers and halo text output")
+    parser.add_argument("--cache_dir", help="Halo cache directory (default: env HALO_CACHE_DIR or ~/.cache/halo_dual_pressio)")
+    parser.add_argument("--no_cache", action="store_true")
+    parser.add_argument("--no_prefetch", action="store_true", help="Do not prepare the next entry in the background")
+    parser.add_argument("--h5_mode", choices=["external", "copy"], default="external")
+    parser.add_argument("--max_memory_mb", type=int, default=default_max_memory_mb(), help="env HALO_MAX_MEMORY_MB")
+    parser.add_argument("--periodic", action="store_true")
+    parser.add_argument("--mutual_match", action="store_true")
+    parser.add_argument("--match_workers", type=int, default=-1)
+    parser.add_argument("--prescreen", action="store_true")
+    parser.add_argument("--prescreen_max_flip_fraction", type=float, default=DEFAULT_MAX_FLIP_FRACTION)
+    parser.add_argument("--prescreen_max_error", type=float, default=DEFAULT_MAX_ERROR)
+    parser.add_argument("--parallel", action="store_true", help="Run each entry's two halo analyses concurrently")
+    parser.add_argument("--threads_per_job", type=int, default=0)
+    parser.add_argument("--trace_dir", default=os.environ.get("HALO_TRACE_DIR"))
+    args = parser.parse_args(argv)
+    if args.halo_backend == "reeber" and not args.external_exe:
+        parser.error("--external_exe is required with --halo_backend reeber")
+    try:
+        out_format = table_format(args.format, args.out)
+        halo_format = table_format(args.format, args.halo_table) if args.halo_table else None
+    except ImportError:
+        parser.error("--format parquet needs pyarrow")
+
+    entries = load_manifest(args.manifest)
+    batch_uuid = uuid.uuid4().hex
+    args.workdir = os.path.abspath(args.workdir)
+    os.makedirs(args.workdir, exist_ok=True)
+    halo_trace.configure(args.trace_dir, batch_uuid, "halo_batch")
+    cache = None if args.no_cache else HaloCache(args.cache_dir)
+    # halo_dual_pressio prints halo:* lines and, on failures, libpressio default metrics; keep stdout for us
+    sys.stdout, hdp.original_stdout = sys.stderr, sys.stderr
+
+    rows, halo_frames = [], []
+    start = time.perf_counter()
+    # one labeling pool for every native run instead of one per find_halos call
+    pool = native_halo_finder.shared_pool(native_halo_finder.workers_within(
+        args.max_memory_mb, args.threads_per_job or hdp.available_cores())) \
+        if args.halo_backend == "native" else nullcontext()
+    with ThreadPoolExecutor(max_workers=1) as io_pool, pool:
+        ahead = None if args.no_prefetch or not entries else \
+            io_pool.submit(prefetch, entries[0], cache, args.external_exe, args.halo_backend)
+        for i, entry in enumerate(entries):
+            if ahead is not None:
+                ahead.result()
+            ahead = None if args.no_prefetch or i + 1 == len(entries) else \
+                io_pool.submit(prefetch, entries[i + 1], cache, args.external_exe, args.halo_backend)
+            t0 = time.perf_counter()
+            try:
+                with stage("entry", entry=entry["name"]):
+                    row, halos = evaluate_entry(entry, i, args, cache, batch_uuid)
+            except (SystemExit, Exception) as e:  # halo_dual_pressio helpers sys.exit() on a failed halo run
+                row, halos = entry_row(entry), None
+                row["status"] = f"failed (exit {e.code})" if isinstance(e, SystemExit) else f"failed ({e!r})"
+            row["seconds"] = time.perf_counter() - t0
+            rows.append(row)
+            if halos is not None:
+                halo_frames.append(halos)
+            print(f"[batch] {i + 1}/{len(entries)} {entry['name']}: {row['status']} ({row['seconds']:.2f}s)",
+                  file=sys.stderr)
+
+    results = pd.DataFrame(rows)
+    out = write_table(results, args.out, out_format)
+    if args.halo_table:
+        halos = pd.concat(halo_frames, ignore_index=True) if halo_frames else \
+            pd.DataFrame(columns=["name", "dist", "mass_orig", "mass_dec"])
+        write_table(halos, args.halo_table, halo_format)
+    elapsed = time.perf_counter() - start
+    failed = int((~results["status"].isin(["ok", "rejected"])).sum())
+    print(f"[batch] {len(rows)} entries in {elapsed:.1f}s ({60 * len(rows) / elapsed:.1f}/min), "
+          f"{failed} not evaluated -> {out}", file=sys.stderr)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
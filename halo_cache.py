@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+"""Persistent on-disk cache for the parsed halo catalog of the original field.
+
+The "original" halo run in halo_dual_pressio.py is a pure function of the input
+bytes, the dims, the halo executable and its flags, so its parsed catalog is
+stored here and reused across evaluations (and across processes).
+
+Usage:
+    python halo_cache.py warm  --input field.f32 --dim 512 --dim 512 --dim 512 --external_exe <exe> [--field F]
+    python halo_cache.py warm  --input field.f32 --dim 512 --dim 512 --dim 512 --halo_backend native
+    python halo_cache.py [--max_bytes N] [--max_age_days D] evict
+    python halo_cache.py stats
+    python halo_cache.py clear
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+
+
+# read the environment at call time: a halo_daemon child only gets its client's env after import
+def default_cache_dir():
+    return os.environ.get("HALO_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "halo_dual_pressio"))
+
+
+def default_max_bytes():
+    return int(os.environ.get("HALO_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+
+def default_max_age_days():
+    return float(os.environ.get("HALO_CACHE_MAX_AGE_DAYS", 30))
+
+
+DEFAULT_CACHE_DIR = default_cache_dir()
+DEFAULT_MAX_BYTES = default_max_bytes()
+DEFAULT_MAX_AGE_DAYS = default_max_age_days()
+
+CATALOG_COLUMNS = ["id", "x", "y", "z", "n_cell", "n_vert", "mass"]
+ENTRY_SUFFIX = ".npz"
+HASH_CHUNK = 16 * 1024 * 1024
+
+
+@contextmanager
+def _locked(path, exclusive=True, blocking=True):
+    """flock() on a side-car lock file; yields False if non-blocking and busy."""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        flags = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        if not blocking:
+            flags |= fcntl.LOCK_NB
+        try:
+            fcntl.flock(fd, flags)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def _atomic_write(path, write_fn, suffix=""):
+    """Write through a temp file in the same directory and rename into place."""
+    d = os.path.dirname(path)
+    fd, tmp = tempfile.mkstemp(dir=d, prefix=".tmp-", suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_fn(f)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+class HaloCache:
+    """Content-addressed store of halo catalogs (one .npz per key)."""
+
+    def __init__(self, root=None, max_bytes=None, max_age_days=None):
+        """Unset arguments come from HALO_CACHE_DIR / HALO_CACHE_MAX_BYTES / HALO_CACHE_MAX_AGE_DAYS."""
+        self.root = os.path.abspath(root or default_cache_dir())
+        self.max_bytes = default_max_bytes() if max_bytes is None else max_bytes
+        self.max_age = (default_max_age_days() if max_age_days is None else max_age_days) * 86400.0
+        self.entries_dir = os.path.join(self.root, "entries")
+        self.digests_dir = os.path.join(self.root, "digests")
+        self.locks_dir = os.path.join(self.root, "locks")
+        for d in (self.entries_dir, self.digests_dir, self.locks_dir):
+            os.makedirs(d, exist_ok=True)
+
+    # ---------------- keys ----------------
+    def file_digest(self, path):
+        """sha256 of a file's bytes, memoized on (path, size, mtime, inode)."""
+        real = os.path.realpath(path)
+        st = os.stat(real)
+        stamp = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "ino": st.st_ino}
+        memo = os.path.join(self.digests_dir, hashlib.sha1(real.encode()).hexdigest() + ".json")
+        try:
+            with open(memo) as f:
+                rec = json.load(f)
+            if rec.get("stamp") == stamp:
+                return rec["sha256"]
+        except (OSError, ValueError, KeyError):
+            pass
+        h = hashlib.sha256()
+        with open(real, "rb") as f:
+            while True:
+                buf = f.read(HASH_CHUNK)
+                if not buf:
+                    break
+                h.update(buf)
+        digest = h.hexdigest()
+        payload = json.dumps({"path": real, "stamp": stamp, "sha256": digest}).encode()
+        _atomic_write(memo, lambda f: f.write(payload), suffix=".json")
+        return digest
+
+    def key(self, binary_file, dims, exe_path, flags):
+        """Cache key for a halo run: input content + dims + exe identity + flags.
+
+        exe_path=None is for in-process backends, which identify themselves by flags.
+        """
+        exe_real, exe_stamp = None, None
+        if exe_path is not None:
+            exe_real = os.path.realpath(exe_path)
+            try:
+                st = os.stat(exe_real)
+                exe_stamp = [st.st_size, st.st_mtime_ns]
+            except OSError:
+                pass
+        desc = {
+            "input": self.file_digest(binary_file),
+            "dims": [int(d) for d in dims],
+            "exe": exe_real,
+            "exe_stamp": exe_stamp,
+            "flags": [str(a) for a in flags],
+        }
+        return hashlib.sha256(json.dumps(desc, sort_keys=True).encode()).hexdigest()
+
+    # ---------------- entries ----------------
+    def _entry_path(self, key):
+        return os.path.join(self.entries_dir, key + ENTRY_SUFFIX)
+
+    def _lock_path(self, name):
+        return os.path.join(self.locks_dir, name + ".lock")
+
+    def __contains__(self, key):
+        return os.path.exists(self._entry_path(key))
+
+    def get(self, key):
+        path = self._entry_path(key)
+        try:
+            with np.load(path) as z:
+                df = pd.DataFrame({c: z[c] for c in CATALOG_COLUMNS})
+        except (OSError, ValueError, KeyError):
+            return None
+        try:
+            os.utime(path)  # LRU: touch on hit
+        except OSError:
+            pass
+        return df
+
+    def put(self, key, df):
+        cols = {}
+        for c in CATALOG_COLUMNS:
+            if c in df:
+                cols[c] = df[c].to_numpy()
+            else:
+                cols[c] = np.empty(0, dtype=np.float64 if c == "mass" else np.int64)
+        _atomic_write(self._entry_path(key), lambda f: np.savez(f, **cols), suffix=ENTRY_SUFFIX)
+        self.evict()
+
+    def get_or_compute(self, key, compute):
+        """Return (df, hit). Concurrent callers with the same key compute it once."""
+        df = self.get(key)
+        if df is not None:
+            return df, True
+        with _locked(self._lock_path(key)):
+            df = self.get(key)
+            if df is not None:
+                return df, True
+            df = compute()
+            self.put(key, df)
+            return df, False
+
+    # ---------------- maintenance ----------------
+    def _list_entries(self):
+        out = []
+        for name in os.listdir(self.entries_dir):
+            if not name.endswith(ENTRY_SUFFIX):
+                continue
+            p = os.path.join(self.entries_dir, name)
+            try:
+                st = os.stat(p)
+            except OSError:
+                continue
+            out.append((st.st_mtime, st.st_size, p))
+        return out
+
+    def evict(self, max_bytes=None, max_age=None):
+        """Drop entries older than max_age, then least-recently-used until under max_bytes."""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age = self.max_age if max_age is None else max_age
+        removed = 0
+        with _locked(self._lock_path("evict"), blocking=False) as got:
+            if not got:
+                return 0  # someone else is already evicting
+            now = time.time()
+            entries = sorted(self._list_entries())
+            total = sum(size for _, size, _ in entries)
+            for mtime, size, p in entries:
+                if (max_age > 0 and now - mtime > max_age) or (max_bytes > 0 and total > max_bytes):
+                    try:
+                        os.remove(p)
+                        removed += 1
+                        total -= size
+                    except OSError:
+                        pass
+        return removed
+
+    def stats(self):
+        entries = self._list_entries()
+        return {"root": self.root, "entries": len(entries),
+                "bytes": sum(size for _, size, _ in entries),
+                "max_bytes": self.max_bytes, "max_age_days": self.max_age / 86400.0}
+
+    def clear(self):
+        removed = 0
+        with _locked(self._lock_path("evict")):
+            for _, _, p in self._list_entries():
+                try:
+                    os.remove(p)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the original-field halo catalog cache")
+    parser.add_argument("--cache_dir", default=default_cache_dir())
+    parser.add_argument("--max_bytes", type=int, default=default_max_bytes())
+    parser.add_argument("--max_age_days", type=float, default=default_max_age_days())
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    warm = sub.add_parser("warm", help="Run the halo finder on original inputs and store the catalogs")
+    warm.add_argument("--input", action="append", required=True, help="Original .f32 field (repeatable)")
+    warm.add_argument("--dim", type=int, action="append", required=True)
+    warm.add_argument("--external_exe", help="reeber exe (required for --halo_backend reeber)")
+    warm.add_argument("--halo_backend", choices=["reeber", "native"], default="reeber")
+    warm.add_argument("--field", help="HDF5 dataset path the reeber exe reads (default native_fields/baryon_density)")
+    sub.add_parser("evict")
+    sub.add_parser("stats")
+    sub.add_parser("clear")
+    args = parser.parse_args()
+
+    cache = HaloCache(args.cache_dir, args.max_bytes, args.max_age_days)
+    if args.cmd == "warm":
+        if args.halo_backend == "reeber" and not args.external_exe:
+            parser.error("warm --halo_backend reeber requires --external_exe")
+        import halo_dual_pressio as hdp
+        # halo_dual_pressio prints halo:* lines and, on failures, libpressio default metrics;
+        # stdout only gets the stats JSON (`halo_cache.py warm ... | jq`)
+        stdout, sys.stdout, hdp.original_stdout = sys.stdout, sys.stderr, sys.stderr
+        try:
+            for path in args.input:
+                df, tmp = hdp.run_halo_analysis(path, args.dim, args.external_exe, "original",
+                                                f"warm{os.getpid()}", cache=cache, backend=args.halo_backend,
+                                                field=args.field or hdp.HALO_FIELD)
+                hdp.cleanup(tmp)
+                print(f"[halo_cache] warmed {path}: {len(df)} halos", file=sys.stderr)
+        finally:
+            sys.stdout = stdout
+    elif args.cmd == "evict":
+        print(f"[halo_cache] evicted {cache.evict()} entries", file=sys.stderr)
+    elif args.cmd == "clear":
+        print(f"[halo_cache] removed {cache.clear()} entries", file=sys.stderr)
+    print(json.dumps(cache.stats()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""Long-lived worker that runs halo_dual_pressio.main() without interpreter startup.
+
+The daemon imports halo_dual_pressio (numpy, pandas, h5py, scipy) once and
+listens on a Unix socket. Each request is served in a forked child, so it
+starts with every module already imported, and concurrent evaluations stay
+isolated (own cwd, HALO_* env, stdout/stderr).
+run_pressio_pipeline.py talks to it through run_via_daemon() and falls back to
+spawning halo_dual_pressio.py when no daemon is listening.
+
+    python halo_daemon.py serve            # foreground
+    python halo_daemon.py status | stop
+
+Protocol: one JSON line per connection each way.
+    request  {"cmd": "run", "script": <path>, "argv": [...], "cwd": <dir>, "env": {HALO_* variables},
+              "timeout": seconds}
+    response {"returncode": int, "stdout": str, "stderr": str} or {"error": str}
+
+A run that takes longer than its timeout (HALO_DAEMON_TIMEOUT, default one
+hour) is killed in the daemon, and the client stops waiting a little later;
+run_via_daemon then returns None, so the caller falls back to a subprocess.
+
+The default socket lives in a 0700 per-user directory, and clients only
+talk to a socket owned by their own uid. Only the client's HALO_* variables
+are forwarded; everything else comes from the daemon's own environment.
+"""
+import argparse
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import sys
+import tempfile
+import traceback
+
+DEFAULT_SOCKET = os.environ.get(
+    "HALO_DAEMON_SOCKET", os.path.join(tempfile.gettempdir(), f"halo_daemon_{os.getuid()}", "daemon.sock"))
+ENV_PREFIX = "HALO_"
+DEFAULT_TIMEOUT = 3600.0
+TIMEOUT_GRACE = 10.0  # client side: let the daemon kill the child and answer first
+
+
+def default_timeout():
+    """Seconds a daemon run may take; HALO_DAEMON_TIMEOUT read at call time."""
+    return float(os.environ.get("HALO_DAEMON_TIMEOUT", DEFAULT_TIMEOUT))
+
+
+def _check_owner(sock_path):
+    """Refuse sockets (and socket directories) that another user could have put there."""
+    st = os.lstat(sock_path)
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+        raise PermissionError(f"{sock_path} is not a socket owned by uid {os.getuid()}")
+
+
+def _secure_dir(path):
+    """Create path as a 0700 directory, or check that an existing one is ours and private."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError(f"{path} must be owned by uid {os.getuid()} and not accessible to others (0700)")
+
+
+def _request(sock_path, payload, timeout=None):
+    _check_owner(sock_path)
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    s.settimeout(timeout)
+    try:
+        s.connect(sock_path)
+        s.sendall(json.dumps(payload).encode() + b"\n")
+        s.shutdown(socket.SHUT_WR)
+        with s.makefile("rb") as f:
+            line = f.readline()
+    finally:
+        s.close()
+    if not line:
+        raise ConnectionError("daemon closed the connection without a reply")
+    return json.loads(line)
+
+
+def run_via_daemon(script, argv, sock_path=DEFAULT_SOCKET, timeout=None):
+    """Run `script argv` in the daemon; returns a response dict, or None when no usable daemon.
+
+    timeout (default: default_timeout()) bounds the run; a run that times
+    out also returns None.
+    """
+    if not os.path.exists(sock_path):
+        return None
+    timeout = default_timeout() if timeout is None else timeout
+    try:
+        resp = _request(sock_path, {"cmd": "run", "script": os.path.realpath(script), "argv": list(argv),
+                                    "cwd": os.getcwd(), "timeout": timeout,
+                                    "env": {k: v for k, v in os.environ.items() if k.startswith(ENV_PREFIX)}},
+                        timeout=timeout + TIMEOUT_GRACE)
+    except PermissionError as e:
+        print(f"[halo_daemon] {e}; falling back to subprocess", file=sys.stderr)
+        return None
+    except socket.timeout:
+        print(f"[halo_daemon] no reply within {timeout:g}s; falling back to subprocess", file=sys.stderr)
+        return None
+    except (OSError, ValueError):
+        return None
+    if "error" in resp:
+        print(f"[halo_daemon] {resp['error']}; falling back to subprocess", file=sys.stderr)
+        return None
+    return resp
+
+
+class _RunTimeout(BaseException):
+    """Raised in the child when a run exceeds its timeout; not an Exception, so nothing in hdp swallows it."""
+
+
+def _on_timeout(signum, frame):
+    # unwind now (subprocess.run kills the halo exe on the way out); if that does not finish
+    # within half the client's grace period, the default SIGALRM action ends the child
+    signal.signal(signal.SIGALRM, signal.SIG_DFL)
+    signal.setitimer(signal.ITIMER_REAL, TIMEOUT_GRACE / 2)
+    raise _RunTimeout
+
+
+def _run_in_child(req):
+    """Executed in the forked child: run halo_dual_pressio.main(argv) with captured streams."""
+    import halo_dual_pressio as hdp
+    if req.get("script") != os.path.realpath(hdp.__file__):
+        return {"error": f"daemon serves {os.path.realpath(hdp.__file__)}, not {req.get('script')}"}
+    os.chdir(req["cwd"])
+    for k in [k for k in os.environ if k.startswith(ENV_PREFIX)]:
+        del os.environ[k]  # the daemon's own HALO_* settings must not leak into a client's run
+    os.environ.update({k: v for k, v in req.get("env", {}).items() if k.startswith(ENV_PREFIX)})
+    out, err = io.StringIO(), io.StringIO()
+    sys.stdout, sys.stderr = out, err
+    hdp.original_stdout = out
+    code = 0
+    timeout = req.get("timeout")
+    if timeout:
+        signal.signal(signal.SIGALRM, _on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        hdp.main(req["argv"])
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except _RunTimeout:
+        return {"error": f"run exceeded its {timeout:g}s timeout"}
+    except BaseException:
+        traceback.print_exc(file=err)
+        code = 1
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+    return {"returncode": code, "stdout": out.getvalue(), "stderr": err.getvalue()}
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            req = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+        cmd = req.get("cmd")
+        if cmd == "ping":
+            resp = {"pid": os.getppid(), "script": os.path.realpath(sys.modules["halo_dual_pressio"].__file__)}
+        elif cmd == "shutdown":
+            os.kill(os.getppid(), signal.SIGTERM)
+            resp = {"ok": True}
+        elif cmd == "run":
+            resp = _run_in_child(req)
+        else:
+            resp = {"error": f"unknown cmd {cmd!r}"}
+        self.wfile.write(json.dumps(resp).encode() + b"\n")
+
+
+class _Server(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    block_on_close = False
+
+
+def serve(sock_path):
+    if sock_path == DEFAULT_SOCKET:
+        _secure_dir(os.path.dirname(sock_path))
+    if os.path.lexists(sock_path):
+        _check_owner(sock_path)
+        try:
+            _request(sock_path, {"cmd": "ping"}, timeout=2)
+            print(f"[halo_daemon] already running on {sock_path}", file=sys.stderr)
+            return 1
+        except (OSError, ValueError):
+            os.remove(sock_path)  # stale socket from a dead daemon
+
+    import halo_dual_pressio  # noqa: F401  warm the heavy imports once, inherited by every fork
+
+    old_umask = os.umask(0o077)  # the socket is private from the moment it exists
+    try:
+        server = _Server(sock_path, _Handler)
+    finally:
+        os.umask(old_umask)
+    os.chmod(sock_path, 0o600)
+
+    def _stop(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, _stop)
+    print(f"[halo_daemon] pid {os.getpid()} listening on {sock_path}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        try:
+            os.remove(sock_path)
+        except OSError:
+            pass
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Persistent halo_dual_pressio worker")
+    parser.add_argument("cmd", choices=["serve", "status", "stop"])
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket path (env HALO_DAEMON_SOCKET)")
+    args = parser.parse_args()
+    if args.cmd == "serve":
+        try:
+            sys.exit(serve(args.socket))
+        except PermissionError as e:
+            print(f"[halo_daemon] {e}", file=sys.stderr)
+            sys.exit(1)
+    try:
+        resp = _request(args.socket, {"cmd": "ping" if args.cmd == "status" else "shutdown"}, timeout=5)
+    except PermissionError as e:
+        print(f"[halo_daemon] {e}", file=sys.stderr)
+        sys.exit(1)
+    except (OSError, ValueError):
+        print(f"[halo_daemon] not running on {args.socket}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(resp))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,25 +1,54 @@
 #!/usr/bin/env python3
 import argparse
 import os
+import re
 import sys
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 import numpy as np
 import pandas as pd
 import h5py
-from scipy.stats import wasserstein_distance
-from sklearn.neighbors import NearestNeighbors
 
 from datetime import datetime
-with open("debug_log.txt", "a") as f:
-    f.write(f"\n[external] called at {datetime.now()} with args: {sys.argv}\n")
+
+from halo_cache import HaloCache, CATALOG_COLUMNS, default_cache_dir
+from halo_matching import match_catalogs, reverse_dists
+import native_halo_finder
+from field_io import DEFAULT_MAX_MEMORY_MB, copy_to_dataset, default_max_memory_mb
+from prescreen import DEFAULT_MAX_ERROR, DEFAULT_MAX_FLIP_FRACTION, prescreen
+import halo_trace
+from halo_trace import stage
+from incremental_halos import (incremental_catalog, DEFAULT_DIFF_BLOCK, DEFAULT_MARGIN,
+                               DEFAULT_MAX_FRACTION)
 
 # 保存原始的 stdout，用于输出 metrics（libpressio 要求）
-# 调试信息输出到 stderr
+# 调试信息输出到 stderr（main() 里重定向）
 original_stdout = sys.stdout
-sys.stdout = sys.stderr  # 默认输出到 stderr
+
+HALO_FIELD = "native_fields/baryon_density"
+HALO_BLOCK = 128
+
+def halo_flags(field=HALO_FIELD):
+    """reeber flags for the dataset `field` of the HDF5 wrapper."""
+    return ["-b", str(HALO_BLOCK), "-n", "-w", "-f", field]
+
+HALO_FLAGS = halo_flags()
+NATIVE_FLAGS = ["native", f"v{native_halo_finder.NATIVE_VERSION}", f"rho={native_halo_finder.DEFAULT_RHO}",
+                f"b={native_halo_finder.DEFAULT_BLOCK}", "wrap"]
+
+_default_metrics_lock = threading.Lock()
+_default_metrics_done = False
 
 def output_default_metrics():
     """Output default metrics in libpressio format before exiting"""
+    global _default_metrics_done
+    # 并行模式下两个 job 都可能失败，只输出一次
+    with _default_metrics_lock:
+        if _default_metrics_done:
+            return
+        _default_metrics_done = True
     print("external:api=1", file=original_stdout)
     print("mean=0.0", file=original_stdout)
     print("median=0.0", file=original_stdout)
@@ -31,84 +60,250 @@ def output_default_metrics():
     print("wasserstein=0.0", file=original_stdout)
     original_stdout.flush()
 
-def run_cmd(cmd):
-    result = subprocess.run(cmd, capture_output=True, text=True)
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+def thread_env(threads):
+    """Environment for a halo job limited to `threads` OpenMP/BLAS/TBB threads."""
+    if not threads:
+        return None
+    env = dict(os.environ)
+    for var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS", "TBB_NUM_THREADS"):
+        env[var] = str(threads)
+    return env
+
+def run_cmd(cmd, env=None):
+    result = subprocess.run(cmd, capture_output=True, text=True, env=env)
     if result.returncode != 0:
         print(result.stderr, file=sys.stderr)
         output_default_metrics()
         sys.exit(1)
     return result
 
-def read_halo_output(filename: str) -> pd.DataFrame:
+HALO_DTYPE = np.dtype([("id", np.int64), ("x", np.int64), ("y", np.int64), ("z", np.int64),
+                       ("n_cell", np.int64), ("n_vert", np.int64), ("mass", np.float64)])
+HALO_READ_CHUNK = 1 << 20  # lines per parse chunk
+HALO_SUB_CHUNK = 512  # lines per re-parse piece once a chunk has a malformed line
+# 6 integer columns and the start of a float mass; cheap, loadtxt still validates what it lets through
+_HALO_LINE = re.compile(r"\s*(?:[-+]?\d+\s+){6}[-+]?[\d.iInN]")
+
+def _load_halo_lines(lines):
+    return np.loadtxt(lines, dtype=HALO_DTYPE, usecols=range(7), comments=None, ndmin=1)
+
+def _parse_halo_lines(lines):
+    """Parse halo finder lines into a HALO_DTYPE array; extra columns are ignored.
+
+    Fast path is a single np.loadtxt call. If any line is malformed (fewer than
+    7 columns, or a field that does not parse as int/float), the chunk is
+    re-parsed in HALO_SUB_CHUNK-line pieces; only the pieces that fail again get
+    one regex pass dropping the bad lines before a last np.loadtxt, so a few bad
+    lines cost a few small pieces rather than the whole chunk.
+    """
+    try:
+        return _load_halo_lines(lines)
+    except (ValueError, OverflowError):
+        pass
+    parts = [_parse_halo_piece(lines[i:i + HALO_SUB_CHUNK]) for i in range(0, len(lines), HALO_SUB_CHUNK)]
+    return np.concatenate(parts) if parts else np.empty(0, dtype=HALO_DTYPE)
+
+def _parse_halo_piece(lines):
+    try:
+        return _load_halo_lines(lines)
+    except (ValueError, OverflowError):
+        pass
+    lines = list(filter(_HALO_LINE.match, lines))
+    if not lines:
+        return np.empty(0, dtype=HALO_DTYPE)
+    try:
+        return _load_halo_lines(lines)
+    except (ValueError, OverflowError):
+        pass  # e.g. an integer beyond int64 or a bad mass: per line below
     rows = []
+    for line in lines:
+        parts = line.split()
+        if len(parts) < 7:
+            continue
+        try:
+            row = (int(parts[0]), int(parts[1]), int(parts[2]), int(parts[3]),
+                   int(parts[4]), int(parts[5]), float(parts[6]))
+        except ValueError:
+            continue
+        if all(-2 ** 63 <= v < 2 ** 63 for v in row[:6]):
+            rows.append(row)
+    return np.array(rows, dtype=HALO_DTYPE)
+
+def read_halo_catalog(filename: str, chunk_lines=HALO_READ_CHUNK) -> np.ndarray:
+    """Read the halo finder text output as a structured array (see HALO_DTYPE).
+
+    The file is parsed chunk_lines lines at a time so peak memory is bounded by
+    one chunk of text plus the typed result; chunk_lines=None reads it in one go.
+    """
+    parts = []
     with open(filename, "r") as f:
-        for line in f:
-            parts = line.strip().split()
-            if len(parts) < 7:
-                continue
-            id_, x, y, z, n_cell, n_vert, mass, *extra = parts
-            try:
-                rows.append({
-                    "id": int(id_),
-                    "x": int(x),
-                    "y": int(y),
-                    "z": int(z),
-                    "n_cell": int(n_cell),
-                    "n_vert": int(n_vert),
-                    "mass": float(mass),
-                })
-            except ValueError:
-                continue
-    return pd.DataFrame(rows)
+        if not chunk_lines:
+            parts.append(_parse_halo_lines(f.readlines()))
+        else:
+            while True:
+                lines = list(islice(f, chunk_lines))
+                if not lines:
+                    break
+                parts.append(_parse_halo_lines(lines))
+    if not parts:
+        return np.empty(0, dtype=HALO_DTYPE)
+    return np.concatenate(parts) if len(parts) > 1 else parts[0]
+
+def read_halo_output(filename: str, chunk_lines=HALO_READ_CHUNK) -> pd.DataFrame:
+    catalog = read_halo_catalog(filename, chunk_lines)
+    return pd.DataFrame({name: catalog[name] for name in HALO_DTYPE.names})
 # print(f"[external] reading {binary_file}", file=sys.stderr)
-def write_h5_from_binary(binary_file, dims, out_h5):
-    data = np.fromfile(binary_file, dtype=np.float32)
+def check_field_size(binary_file, dims):
+    """Number of float32 elements; skips the evaluation (default metrics, exit 0) on a size mismatch."""
     expected = int(np.prod(dims))
-    if data.size != expected:
-        print(f"[external] skip: data.size={data.size}, expected={expected}", file=sys.stderr)
+    size = os.path.getsize(binary_file) // 4  # float32
+    if size != expected:
+        print(f"[external] skip: data.size={size}, expected={expected}", file=sys.stderr)
         output_default_metrics()
         sys.exit(0)  # ⭐ 关键：一定是 0，不是 1
-    data = data.reshape(tuple(reversed(dims)))
-    with h5py.File(out_h5, "w") as f:
-        grp = f.require_group("native_fields")
-        if "baryon_density" in grp:
-            del grp["baryon_density"]
-        grp.create_dataset("baryon_density", data=data)
-
-def run_halo_analysis(binary_file, dims, exe_path, tag, eval_uuid):
-    tmp_h5  = f"{tag}_{eval_uuid}.h5"
-    tmp_out = f"halo_output_{tag}_{eval_uuid}.txt"
-
-    write_h5_from_binary(binary_file, dims, tmp_h5)
-
-    cmd = [
-        exe_path, "-b", "128", "-n", "-w",
-        "-f", "native_fields/baryon_density", 
-        tmp_h5, "none", "none", tmp_out
-    ]
-    run_cmd(cmd)
+    return expected
+
+def write_h5_from_binary(binary_file, dims, out_h5, mode="external", max_memory_mb=DEFAULT_MAX_MEMORY_MB,
+                         field=HALO_FIELD):
+    """Expose a raw float32 field to the halo exe as dataset `field` (default HALO_FIELD) inside out_h5.
+
+    mode="external" (default) writes a tiny HDF5 file whose dataset uses external
+    storage pointing at the raw bytes of binary_file, so nothing is read into
+    Python and nothing big is written; the exe reads the .f32 in place.
+    mode="copy" writes a full HDF5 copy, streamed in HALO_BLOCK-aligned tiles
+    and chunks so no more than about max_memory_mb is resident.
+    """
+    expected = check_field_size(binary_file, dims)
+    shape = tuple(reversed(dims))
+    grp_name, ds_name = field.rsplit("/", 1) if "/" in field else ("/", field)
+    with stage("h5_write", mode=mode), h5py.File(out_h5, "w", rdcc_nbytes=max_memory_mb * 2 ** 20 // 4) as f:
+        grp = f.require_group(grp_name)
+        if ds_name in grp:
+            del grp[ds_name]
+        if mode == "external":
+            # 绝对路径：exe 的工作目录不一定和我们一样
+            grp.create_dataset(ds_name, shape=shape, dtype="<f4",
+                               external=[(os.path.abspath(binary_file), 0, expected * 4)])
+        else:
+            copy_to_dataset(binary_file, dims, grp, ds_name, HALO_BLOCK, max_memory_mb)
+
+def run_halo_finder(binary_file, dims, exe_path, tag, eval_uuid, threads=None, h5_mode="external",
+                    workdir=".", max_memory_mb=DEFAULT_MAX_MEMORY_MB, field=HALO_FIELD):
+    tmp_h5  = os.path.join(workdir, f"{tag}_{eval_uuid}.h5")
+    tmp_out = os.path.join(workdir, f"halo_output_{tag}_{eval_uuid}.txt")
+
+    write_h5_from_binary(binary_file, dims, tmp_h5, mode=h5_mode, max_memory_mb=max_memory_mb, field=field)
+
+    cmd = [exe_path] + halo_flags(field) + [tmp_h5, "none", "none", tmp_out]
+    with stage("halo_exe", tag=tag, threads=threads):
+        run_cmd(cmd, env=thread_env(threads))
 
     if not os.path.exists(tmp_out):
         print(f"❌ halo output not found: {tmp_out}", file=sys.stderr)
         output_default_metrics()
         sys.exit(1)
 
-    df = read_halo_output(tmp_out)
+    with stage("read_halo_output", tag=tag):
+        df = read_halo_output(tmp_out)
+    return df, [tmp_h5, tmp_out]
+
+def run_native_halo_finder(binary_file, dims, exe_path, tag, eval_uuid, threads=None, h5_mode=None,
+                           workdir=".", max_memory_mb=DEFAULT_MAX_MEMORY_MB, field=None):
+    """In-process backend (native_halo_finder): no HDF5 wrapper, no subprocess, no text re-parse."""
+    check_field_size(binary_file, dims)
+    workers = native_halo_finder.workers_within(max_memory_mb, threads or available_cores())
+    with stage("native_find_halos", tag=tag, workers=workers):
+        df = native_halo_finder.find_halos(binary_file, dims, workers=workers)
+    return df, []
+
+# name -> (finder, cache flags for a field); finders share run_halo_finder's signature and return (df, tmp_paths)
+HALO_BACKENDS = {
+    "reeber": (run_halo_finder, halo_flags),
+    "native": (run_native_halo_finder, lambda field: NATIVE_FLAGS),  # reads the raw file, field name unused
+}
+
+def run_halo_analysis(binary_file, dims, exe_path, tag, eval_uuid, cache=None, threads=None,
+                      h5_mode="external", workdir=".", backend="reeber", max_memory_mb=DEFAULT_MAX_MEMORY_MB,
+                      field=HALO_FIELD):
+    """Run the halo finder on one field; with a cache, reuse catalogs of identical inputs."""
+    finder, flags_for = HALO_BACKENDS[backend]
+    flags = flags_for(field)
+    with stage("halo_analysis", tag=tag, backend=backend) as trace:
+        if cache is None:
+            df, tmp = finder(binary_file, dims, exe_path, tag, eval_uuid, threads, h5_mode, workdir, max_memory_mb,
+                             field)
+        else:
+            tmp = []
+            def compute():
+                df, paths = finder(binary_file, dims, exe_path, tag, eval_uuid, threads, h5_mode, workdir,
+                                   max_memory_mb, field)
+                tmp.extend(paths)
+                return df
+            key = cache.key(binary_file, dims, exe_path if backend == "reeber" else None, flags)
+            df, hit = cache.get_or_compute(key, compute)
+            trace["cache"] = "hit" if hit else "miss"
+            print(f"[external] halo cache {'hit' if hit else 'miss'} for {tag} ({key[:12]})", file=sys.stderr)
+    if "mass" not in df:
+        df = pd.DataFrame(columns=CATALOG_COLUMNS)
+    report_catalog(tag, df)
+    return df, tmp
+
+def report_catalog(tag, df):
     print(f"halo:{tag}_num_halos={len(df)}")
     print(f"halo:{tag}_total_mass={df['mass'].sum():.4e}")
-    return df, [tmp_h5, tmp_out]
-def compute_metrics(df_orig: pd.DataFrame, df_dec: pd.DataFrame):
-    orig_xyz = df_orig[['x', 'y', 'z']].to_numpy()
-    dec_xyz = df_dec[['x', 'y', 'z']].to_numpy()
-    mass_orig = df_orig['mass'].to_numpy()
-    mass_dec = df_dec['mass'].to_numpy()
-    nn = NearestNeighbors(n_neighbors=1, algorithm='kd_tree').fit(dec_xyz)
-    dists, idx = nn.kneighbors(orig_xyz)
-    dists = dists.flatten()
-    idx   = idx.flatten()
-    mass_dec = mass_dec[idx]
-
-    return dists, mass_orig, mass_dec
+
+def run_incremental_analysis(df_orig, orig_file, dec_file, dims, args):
+    """Decompressed catalog via incremental_halos; None when too much changed (caller runs the full finder)."""
+    with stage("incremental") as trace:
+        df, info = incremental_catalog(df_orig, orig_file, dec_file, dims, block=args.incremental_block,
+                                       margin=args.incremental_margin, max_fraction=args.incremental_max_fraction,
+                                       workers=native_halo_finder.workers_within(
+                                           args.max_memory_mb, args.threads_per_job or available_cores()))
+        trace.update(info)
+    print(f"[external] incremental: {info['dirty_blocks']}/{info['blocks']} blocks changed, "
+          f"{info['regions']} regions, {info['grown']} box regrowths, {info['fraction']:.1%} of the volume", file=sys.stderr)
+    if df is None:
+        print("[external] incremental: too much changed, running the full analysis", file=sys.stderr)
+        return None
+    report_catalog("decompressed", df)
+    return df
+
+def run_halo_pair(jobs, threads_per_job=0):
+    """Run independent run_halo_analysis jobs concurrently, results in job order.
+
+    The heavy work is the halo subprocess, so a thread pool is enough; each job
+    gets an equal share of the cores unless threads_per_job is given, and an equal
+    share of max_memory_mb. A job that
+    fails calls output_default_metrics()/sys.exit() exactly as in serial mode and
+    the SystemExit is re-raised here in job order.
+    """
+    cores = available_cores()
+    workers = max(1, min(len(jobs), cores))
+    threads = threads_per_job or max(1, cores // workers)
+    print(f"[external] parallel: {workers} jobs x {threads} threads ({cores} cores)", file=sys.stderr)
+    jobs = [(job_args, dict(job_kwargs, max_memory_mb=max(1, job_kwargs["max_memory_mb"] // workers)))
+            if "max_memory_mb" in job_kwargs else (job_args, job_kwargs) for job_args, job_kwargs in jobs]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_halo_analysis, *job_args, threads=threads, **job_kwargs)
+                   for job_args, job_kwargs in jobs]
+        return [f.result() for f in futures]
+
+def compute_metrics(df_orig: pd.DataFrame, df_dec: pd.DataFrame, dims=None, periodic=False, mutual=False,
+                    workers=-1):
+    """(dists, mass_orig, mass_dec) of original halos matched to decompressed ones (see halo_matching)."""
+    with stage("match", n_orig=len(df_orig), n_dec=len(df_dec)):
+        return match_catalogs(df_orig, df_dec, dims, periodic=periodic, mutual=mutual, workers=workers)
+
+def compute_reverse_dists(df_orig: pd.DataFrame, df_dec: pd.DataFrame, dims=None, periodic=False, workers=-1):
+    """NN distance from each decompressed halo to the original catalog (for p99_sym)."""
+    with stage("match_reverse", n_orig=len(df_orig), n_dec=len(df_dec)):
+        return reverse_dists(df_orig, df_dec, dims, periodic=periodic, workers=workers)
 
 def cleanup(paths):
     for p in paths:
@@ -118,15 +313,66 @@ def cleanup(paths):
         except OSError:
             pass
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Pressio external: dual halo + metrics (merged)")
     parser.add_argument("--input", required=True)
     parser.add_argument("--decompressed", required=True)
-    parser.add_argument("--external_exe", required=True)
+    parser.add_argument("--external_exe", help="reeber amr_connected_components_float (required for --halo_backend reeber)")
+    parser.add_argument("--halo_backend", choices=["reeber", "native"], default="reeber",
+                        help="reeber: external exe; native: in-process NumPy/SciPy connected components")
     parser.add_argument("--dim", type=int, action="append", required=True)
     parser.add_argument("--original_input", help="Path to original uncompressed input file")
     parser.add_argument("--eval_uuid", default="default")
-    args, _ = parser.parse_known_args()
+    parser.add_argument("--workdir", default=".",
+                        help="Per-evaluation workspace for temp files, CSVs, .npy outputs and the debug log")
+    # env defaults are read here, not at import, so a halo_daemon child sees its client's HALO_* variables
+    parser.add_argument("--cache_dir", default=default_cache_dir(),
+                        help="Cache for the original-field halo catalog (env HALO_CACHE_DIR)")
+    parser.add_argument("--no_cache", action="store_true", help="Always rerun the original halo analysis")
+    parser.add_argument("--h5_mode", choices=["external", "copy"], default="external",
+                        help="external: zero-copy HDF5 wrapper over the raw .f32; copy: HDF5 rewrite, streamed in chunks")
+    parser.add_argument("--max_memory_mb", type=int, default=default_max_memory_mb(),
+                        help="Resident memory budget for field I/O and native labeling (env HALO_MAX_MEMORY_MB)")
+    parser.add_argument("--periodic", action="store_true",
+                        help="Match halos with periodic distances in the dims box (the halo finder runs with -w)")
+    parser.add_argument("--mutual_match", action="store_true",
+                        help="Keep only mutual nearest-neighbour (one-to-one) halo pairs")
+    parser.add_argument("--match_workers", type=int, default=-1, help="Threads for kd-tree queries (-1: all cores)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Re-analyse only blocks whose threshold membership changed (needs --halo_backend native)")
+    parser.add_argument("--incremental_block", type=int, default=DEFAULT_DIFF_BLOCK, help="Diff block size (cells)")
+    parser.add_argument("--incremental_margin", type=int, default=DEFAULT_MARGIN,
+                        help="Cells of context around changed blocks")
+    parser.add_argument("--incremental_max_fraction", type=float, default=DEFAULT_MAX_FRACTION,
+                        help="Fall back to the full analysis above this changed-volume fraction")
+    parser.add_argument("--prescreen", action="store_true",
+                        help="Pre-screen the raw fields: skip the decompressed halo run when identical above the "
+                             "threshold, skip both runs when clearly out of bounds (decision in prescreen.json)")
+    parser.add_argument("--prescreen_max_flip_fraction", type=float, default=DEFAULT_MAX_FLIP_FRACTION,
+                        help="Reject when this fraction of above-threshold cells crosses the threshold")
+    parser.add_argument("--prescreen_max_error", type=float, default=DEFAULT_MAX_ERROR,
+                        help="Reject when the max error above the threshold exceeds this multiple of it (default: off)")
+    parser.add_argument("--trace_dir", default=os.environ.get("HALO_TRACE_DIR"),
+                        help="Append per-stage timing/memory records to <trace_dir>/<eval_uuid>.jsonl (env HALO_TRACE_DIR)")
+    parser.add_argument("--parallel", action="store_true",
+                        help="Run the original and decompressed halo analyses concurrently")
+    parser.add_argument("--threads_per_job", type=int, default=0,
+                        help="Thread budget per halo job in --parallel mode (default: cores / jobs)")
+    args, _ = parser.parse_known_args(argv)
+    if args.halo_backend == "reeber" and not args.external_exe:
+        parser.error("--external_exe is required with --halo_backend reeber")
+    if args.incremental and args.halo_backend != "native":
+        parser.error("--incremental splices native_halo_finder results and needs --halo_backend native")
+
+    halo_trace.configure(args.trace_dir, args.eval_uuid, "halo_dual_pressio")
+    workdir = os.path.abspath(args.workdir)
+    os.makedirs(workdir, exist_ok=True)
+    debug_log = os.path.join(workdir, "debug_log.txt")
+    with open(debug_log, "a") as f:
+        f.write(f"\n[external] called at {datetime.now()} with args: {sys.argv if argv is None else argv}\n")
+    sys.stdout = sys.stderr  # 默认输出到 stderr
+
+    cache = None if args.no_cache else HaloCache(args.cache_dir)
 
     dims = args.dim
     
@@ -183,7 +429,7 @@ def main():
         
         # If input file is much smaller than expected, it's likely compressed
         if input_elements < expected_elements * 0.1:
-            with open("debug_log.txt", "a") as f:
+            with open(debug_log, "a") as f:
                 # f.write(f"\n[external] called at {datetime.now()} with args: {sys.argv}\n")
                 print(f"[external] skip: input file is compressed ({input_elements} elements)fffff, expected {expected_elements} elements", file=f)
 
@@ -210,23 +456,66 @@ def main():
 
   
     tmp_to_clean = []
-    df_orig, tmp1 = run_halo_analysis(input_file_to_use, dims, args.external_exe,
-                                      "original", args.eval_uuid)
-    df_dec,  tmp2 = run_halo_analysis(args.decompressed, dims, args.external_exe,
-                                      "decompressed", args.eval_uuid)
+    halo_kwargs = {"h5_mode": args.h5_mode, "workdir": workdir, "backend": args.halo_backend,
+                   "max_memory_mb": args.max_memory_mb}
+    decision = "full"
+    if args.prescreen:
+        check_field_size(args.decompressed, dims)
+        with stage("prescreen") as trace:
+            screen = prescreen(input_file_to_use, args.decompressed, dims, native_halo_finder.DEFAULT_RHO, workdir,
+                               args.prescreen_max_flip_fraction, args.prescreen_max_error, HALO_BLOCK,
+                               args.max_memory_mb)
+            trace["decision"] = screen["decision"]
+        decision = screen["decision"]
+        print(f"[external] prescreen: {decision} ({screen['reason']}; {screen['n_flip']} flips, "
+              f"max error above threshold {screen['max_error_above']:.4g}, {screen['seconds']:.2f}s)",
+              file=sys.stderr)
+        if decision == "reject":
+            return  # no arrays: run_pressio_pipeline.py reports the prescreen record instead
+    if decision == "exact":
+        # 阈值以上完全一致：解压场的 halo 目录就是原始场的
+        df_orig, tmp1 = run_halo_analysis(input_file_to_use, dims, args.external_exe,
+                                          "original", args.eval_uuid, cache=cache, **halo_kwargs)
+        df_dec, tmp2 = df_orig.copy(), []
+        report_catalog("decompressed", df_dec)
+    elif args.incremental:
+        df_orig, tmp1 = run_halo_analysis(input_file_to_use, dims, args.external_exe,
+                                          "original", args.eval_uuid, cache=cache, **halo_kwargs)
+        check_field_size(args.decompressed, dims)
+        df_dec, tmp2 = run_incremental_analysis(df_orig, input_file_to_use, args.decompressed, dims, args), []
+        if df_dec is None:
+            df_dec, tmp2 = run_halo_analysis(args.decompressed, dims, args.external_exe,
+                                             "decompressed", args.eval_uuid, **halo_kwargs)
+    elif args.parallel:
+        (df_orig, tmp1), (df_dec, tmp2) = run_halo_pair([
+            ((input_file_to_use, dims, args.external_exe, "original", args.eval_uuid),
+             dict(halo_kwargs, cache=cache)),
+            ((args.decompressed, dims, args.external_exe, "decompressed", args.eval_uuid), halo_kwargs),
+        ], args.threads_per_job)
+    else:
+        df_orig, tmp1 = run_halo_analysis(input_file_to_use, dims, args.external_exe,
+                                          "original", args.eval_uuid, cache=cache, **halo_kwargs)
+        df_dec,  tmp2 = run_halo_analysis(args.decompressed, dims, args.external_exe,
+                                          "decompressed", args.eval_uuid, **halo_kwargs)
     tmp_to_clean.extend(tmp1 + tmp2)
 
     # 如果你还想保留 halo 的 CSV，可以保留这两行；不需要可以删掉
-    df_orig.to_csv("halo_original.csv", index=False)
-    df_dec.to_csv("halo_decompressed.csv", index=False)
+    with stage("write_csv"):
+        df_orig.to_csv(os.path.join(workdir, "halo_original.csv"), index=False)
+        df_dec.to_csv(os.path.join(workdir, "halo_decompressed.csv"), index=False)
 
     # 只关心 dists：compute_metrics 返回 (dists, mass_orig, mass_dec)
-    dists, mass_orig, mass_dec = compute_metrics(df_orig, df_dec)
+    dists, mass_orig, mass_dec = compute_metrics(df_orig, df_dec, dims, periodic=args.periodic,
+                                                 mutual=args.mutual_match, workers=args.match_workers)
 
     # 保存 dists，供 run_pressio_pipeline.py 或其他代码读取
-    np.save("dists.npy", dists)
-    np.save("mass_orig.npy", mass_orig)
-    np.save("mass_dec.npy", mass_dec)   
+    dists_rev = compute_reverse_dists(df_orig, df_dec, dims, periodic=args.periodic, workers=args.match_workers)
+    with stage("write_arrays"):
+        np.save(os.path.join(workdir, "dists.npy"), dists)
+        np.save(os.path.join(workdir, "mass_orig.npy"), mass_orig)
+        np.save(os.path.join(workdir, "mass_dec.npy"), mass_dec)
+        np.save(os.path.join(workdir, "dists_rev.npy"), dists_rev)
+        np.save(os.path.join(workdir, "n_halos.npy"), np.array([len(df_orig), len(df_dec)], dtype=np.int64))
     # 调试信息写到 stderr，不影响 external stdout 协议
     print(f"[external] saved dists, shape={dists.shape}", file=sys.stderr)
 
@@ -0,0 +1,45 @@
+"""Summary metrics over the matched-halo arrays (dists, mass_orig, mass_dec).
+
+Kept free of pandas/h5py/sklearn so the thin libpressio entry point can reduce
+the arrays without paying for the heavy imports. scipy.stats (~1s to import)
+is only loaded inside summarize(), so the probe call never pays for it.
+"""
+import numpy as np
+
+SUMMARY_KEYS = ["mean", "median", "p90", "p99", "p999", "max", "p99_sym", "wasserstein"]
+ARRAY_NAMES = ["dists", "mass_orig", "mass_dec"]
+# decompressed -> original NN distances; [n_orig, n_dec] catalog sizes
+OPTIONAL_ARRAY_NAMES = ["dists_rev", "n_halos"]
+
+
+def summarize(dists, mass_orig, mass_dec, dists_rev=None):
+    """Reduce the per-halo arrays to the metrics reported in metrics_summary.csv.
+
+    p99_sym is the 99th percentile of the symmetric NN distance, i.e. over the
+    original->decompressed and decompressed->original distances together
+    (falls back to dists alone without dists_rev). Two empty catalogs give
+    all-zero metrics, like output_default_metrics(). Unmatched halos (inf
+    distances: one of the catalogs is empty) make every metric inf.
+    """
+    from scipy.stats import wasserstein_distance
+
+    dists = np.asarray(dists, dtype=np.float64)
+    mass_orig = np.asarray(mass_orig, dtype=np.float64)
+    mass_dec = np.asarray(mass_dec, dtype=np.float64)
+    rev = np.empty(0) if dists_rev is None else np.asarray(dists_rev, dtype=np.float64)
+    if dists.size == 0 and rev.size == 0:
+        return {k: 0.0 for k in SUMMARY_KEYS}
+    if dists.size == 0 or not (np.isfinite(dists).all() and np.isfinite(rev).all()):
+        return {k: float("inf") for k in SUMMARY_KEYS}
+    p50, p90, p99, p999 = np.percentile(dists, [50, 90, 99, 99.9])
+    sym = dists if dists_rev is None else np.concatenate([dists, rev])
+    return {
+        "mean": float(np.mean(dists)),
+        "median": float(p50),
+        "p90": float(p90),
+        "p99": float(p99),
+        "p999": float(p999),
+        "max": float(np.max(dists)),
+        "p99_sym": float(np.percentile(sym, 99)),
+        "wasserstein": float(wasserstein_distance(mass_orig, mass_dec)),
+    }
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Per-stage wall time, CPU time and peak RSS, as JSON lines per evaluation.
+
+halo_dual_pressio.py and run_pressio_pipeline.py wrap their stages in
+stage("name"). When tracing is configured (--trace_dir or env
+HALO_TRACE_DIR), every stage appends one record to <trace_dir>/<eval_uuid>.jsonl:
+
+    {"eval_uuid", "process", "pid", "stage", "start", "wall_s", "cpu_s",
+     "children_cpu_s", "rss_peak_mb", "children_rss_max_mb", "ok", ...extra fields}
+
+cpu_s is this process (all threads), children_cpu_s the subprocesses that
+finished during the stage (the halo exe, pressio). The kernel only counts
+reaped children per process, so children_cpu_s is null when a stage of
+another thread started or ended while this one ran (run_halo_pair): the
+children of both would be counted twice. Stages that start no subprocesses
+pass children=False and do not count as overlapping.
+rss_peak_mb is the peak resident set of this process during the stage. It
+comes from VmHWM, which is reset through /proc/self/clear_refs. Where that
+reset is unavailable it is the process peak so far. children_rss_max_mb is
+not per stage: it is the largest resident set of any child reaped so far
+in the process's lifetime (RUSAGE_CHILDREN ru_maxrss).
+Without a trace dir, stage() only yields.
+
+    python halo_trace.py summarize <trace_dir or .jsonl ...> [--json]
+"""
+import argparse
+import glob
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_lock = threading.Lock()
+_config = {"path": None, "eval_uuid": None, "process": None}
+_open = {}  # id -> [running peak MB] of every stage in flight, in this process
+_threads = {}  # id -> [thread ident, starts children, overlapped] of every stage in flight
+
+
+def configure(trace_dir, eval_uuid, process):
+    """Enable tracing for this process; trace_dir None disables it."""
+    if trace_dir:
+        os.makedirs(trace_dir, exist_ok=True)
+        _config["path"] = os.path.join(trace_dir, f"{eval_uuid}.jsonl")
+    else:
+        _config["path"] = None
+    _config["eval_uuid"] = eval_uuid
+    _config["process"] = process
+
+
+def enabled():
+    return _config["path"] is not None
+
+
+def _hwm_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _reset_hwm():
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _observe_peak():
+    """Fold the current high-water mark into every open stage, then restart it (call with _lock held)."""
+    hwm = _hwm_mb()
+    for peak in _open.values():
+        peak[0] = max(peak[0], hwm)
+    _reset_hwm()
+
+
+def _mark_overlap(me):
+    """A stage starts or ends: the stages in flight in other threads now overlap it (call with _lock held)."""
+    thread, children, _ = _threads[me]
+    if not children:
+        return
+    for other, state in _threads.items():
+        if state[0] != thread:
+            state[2] = True
+
+
+def write_record(record):
+    line = json.dumps(record) + "\n"
+    # one write() on an O_APPEND fd: lines from concurrent processes don't interleave
+    fd = os.open(_config["path"], os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line.encode())
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def stage(name, children=True, **fields):
+    """Time the enclosed block as stage `name`; extra fields are stored with the record.
+
+    children=False declares that the block starts no subprocesses, so stages
+    running in other threads meanwhile keep their children_cpu_s.
+    """
+    if not enabled():
+        yield fields
+        return
+    peak = [0.0]
+    with _lock:
+        _observe_peak()
+        _open[id(peak)] = peak
+        _threads[id(peak)] = [threading.get_ident(), children, False]
+        _mark_overlap(id(peak))
+    start = time.time()
+    wall0, cpu0 = time.perf_counter(), time.process_time()
+    rusage0 = resource.getrusage(resource.RUSAGE_CHILDREN)
+    ok = False
+    try:
+        yield fields  # callers may add fields (e.g. cache hit) while the stage runs
+        ok = True
+    finally:
+        wall, cpu = time.perf_counter() - wall0, time.process_time() - cpu0
+        rusage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        with _lock:
+            _observe_peak()
+            _mark_overlap(id(peak))
+            overlapped = _threads.pop(id(peak))[2]
+            del _open[id(peak)]
+        children_cpu = (rusage.ru_utime + rusage.ru_stime) - (rusage0.ru_utime + rusage0.ru_stime)
+        write_record({
+            "eval_uuid": _config["eval_uuid"], "process": _config["process"], "pid": os.getpid(),
+            "stage": name, "start": start, "wall_s": wall, "cpu_s": cpu,
+            "children_cpu_s": None if overlapped else children_cpu,
+            "rss_peak_mb": peak[0], "children_rss_max_mb": rusage.ru_maxrss / 1024, "ok": ok, **fields,
+        })
+
+
+def load_traces(paths):
+    """Records from trace files and/or directories of them."""
+    records = []
+    for p in paths:
+        files = sorted(glob.glob(os.path.join(p, "*.jsonl"))) if os.path.isdir(p) else [p]
+        for path in files:
+            with open(path) as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue  # torn line from a killed process
+    return records
+
+
+def summarize(records):
+    """Per-(process, stage) breakdown over all evaluations, slowest total first."""
+    groups = {}
+    for r in records:
+        groups.setdefault((r["process"], r["stage"]), []).append(r)
+    evals = len({r["eval_uuid"] for r in records})
+    rows = []
+    for (process, name), recs in groups.items():
+        walls = sorted(r["wall_s"] for r in recs)
+        rows.append({
+            "process": process, "stage": name, "count": len(recs), "evals": evals,
+            "wall_total_s": sum(walls), "wall_mean_s": sum(walls) / len(walls),
+            "wall_p95_s": walls[min(len(walls) - 1, int(0.95 * len(walls)))],
+            # children_cpu_s is null for stages that overlapped another thread's (see the module docstring)
+            "cpu_total_s": sum(r["cpu_s"] + (r.get("children_cpu_s") or 0.0) for r in recs),
+            "rss_peak_mb": max(r["rss_peak_mb"] for r in recs),
+            "failed": sum(not r["ok"] for r in recs),
+        })
+    return sorted(rows, key=lambda row: -row["wall_total_s"])
+
+
+def _print_table(rows):
+    cols = ["process", "stage", "count", "wall_total_s", "wall_mean_s", "wall_p95_s", "cpu_total_s",
+            "rss_peak_mb", "failed"]
+    cells = [[f"{row[c]:.3f}" if isinstance(row[c], float) else str(row[c]) for c in cols] for row in rows]
+    widths = [max(len(c), *(len(r[i]) for r in cells)) for i, c in enumerate(cols)]
+    print("  ".join(c.ljust(w) for c, w in zip(cols, widths)))
+    for r in cells:
+        print("  ".join(v.ljust(w) for v, w in zip(r, widths)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize halo stage traces")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("summarize", help="Per-stage breakdown of one or more traces")
+    p.add_argument("paths", nargs="+", help="Trace .jsonl files or directories of them")
+    p.add_argument("--json", action="store_true", help="Print the rows as JSON instead of a table")
+    args = parser.parse_args()
+    records = load_traces(args.paths)
+    if not records:
+        print("[halo_trace] no trace records found", file=sys.stderr)
+        sys.exit(1)
+    rows = summarize(records)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"{rows[0]['evals']} evaluations, {len(records)} stage records")
+        _print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""Incremental halo re-analysis of a decompressed field against a cached original catalog.
+
+For tight error bounds almost every cell of the decompressed field stays on
+the same side of the halo threshold as the original. Instead of re-running
+the halo finder over the whole field:
+
+1. diff the two raw fields block by block, and flag the blocks where threshold
+   membership changes (original vs. its threshold, decompressed vs. its own);
+2. group touching flagged blocks into disjoint inner boxes and grow each by a
+   margin (periodically across the field edge);
+3. label both fields inside each box, and splice: every original halo with a
+   cell in or next to an inner box is dropped, every decompressed one is
+   added. A halo of either field that reaches the face of its box may go on
+   outside it, so that box is grown (margin doubled) and labeled again.
+
+Halos away from changed blocks keep their original catalog entry: their
+cells are the same in both fields, only their mass differs by the
+compression error.
+When the boxes cover more than max_fraction of the volume the caller should
+run the full analysis instead (incremental_catalog returns None).
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+
+from native_halo_finder import (CATALOG_COLUMNS, DEFAULT_RHO, block_slices, block_sum, find_halos, open_field,
+                                process_pool)
+
+DEFAULT_DIFF_BLOCK = 32
+DEFAULT_MARGIN = 32
+DEFAULT_MAX_FRACTION = 0.25
+
+
+def _block_flips(task):
+    orig, dec, shape, (z0, z1, y0, y1, x0, x1), thr_o, thr_d = task
+    a = np.asarray(open_field(orig, shape)[z0:z1, y0:y1, x0:x1])
+    b = np.asarray(open_field(dec, shape)[z0:z1, y0:y1, x0:x1])
+    return bool(np.any((a > thr_o) != (b > thr_d)))
+
+
+def changed_blocks(orig_file, dec_file, dims, rho=DEFAULT_RHO, block=DEFAULT_DIFF_BLOCK, workers=None):
+    """Boolean block grid of blocks whose threshold membership differs; also returns (thr_orig, thr_dec)."""
+    shape = tuple(int(d) for d in reversed(dims))
+    slices, grid = block_slices(shape, block)
+    n = float(np.prod(shape))
+    with process_pool(workers) as pool:
+        thr_o = rho * sum(pool.map(block_sum, [(orig_file, shape, s) for s in slices])) / n
+        thr_d = rho * sum(pool.map(block_sum, [(dec_file, shape, s) for s in slices])) / n
+        flips = list(pool.map(_block_flips, [(orig_file, dec_file, shape, s, thr_o, thr_d) for s in slices]))
+    return np.array(flips, dtype=bool).reshape(grid), (thr_o, thr_d)
+
+
+def _overlap(a, b):
+    return all(a[2 * k] < b[2 * k + 1] and b[2 * k] < a[2 * k + 1] for k in range(3))
+
+
+def dirty_regions(dirty, block, shape, margin=DEFAULT_MARGIN):
+    """Cell boxes to re-label around the dirty blocks: [(box, inner), ...], each (z0, z1, y0, y1, x0, x1).
+
+    Every group of touching dirty blocks gets its own inner box, their
+    bounding box (merged with any inner box it overlaps, so inner boxes stay
+    disjoint), and a box that is the inner box grown by margin. Boxes may
+    overlap. A box crossing the field edge keeps going on the other side
+    (bounds below 0 or past the shape, read periodically by find_halos); one
+    as wide as the field along an axis spans it and wraps.
+    """
+    if not dirty.any():
+        return []
+    lab, _ = ndimage.label(dirty, structure=np.ones((3, 3, 3), dtype=bool))
+    inners = []
+    for sl in ndimage.find_objects(lab):
+        inner = []
+        for k, s in enumerate(sl):
+            inner += [s.start * block, min(s.stop * block, shape[k])]
+        inners.append(inner)
+    merged = True
+    while merged:  # bounding boxes of separate groups may still overlap
+        merged = False
+        for i in range(len(inners)):
+            for j in range(i + 1, len(inners)):
+                if _overlap(inners[i], inners[j]):
+                    a, b = inners[i], inners.pop(j)
+                    inners[i] = [min(a[k], b[k]) if k % 2 == 0 else max(a[k], b[k]) for k in range(6)]
+                    merged = True
+                    break
+            if merged:
+                break
+    return [(grow_box(inner, margin, shape), tuple(inner)) for inner in inners]
+
+
+def grow_box(inner, margin, shape):
+    """inner grown by margin on every side; [0, shape] along an axis it would cover completely."""
+    box = []
+    for k in range(3):
+        lo, hi = inner[2 * k] - margin, inner[2 * k + 1] + margin
+        box += [0, shape[k]] if hi - lo >= shape[k] else [lo, hi]
+    return tuple(box)
+
+
+def seed_intervals(inner, box, shape):
+    """inner grown by one cell (face neighbours can join or split a halo), as find_halos seed intervals of box."""
+    seed = []
+    for k in range(3):
+        lo, hi = inner[2 * k] - 1, inner[2 * k + 1] + 1
+        if (box[2 * k], box[2 * k + 1]) != (0, shape[k]):
+            seed.append([(max(lo, box[2 * k]), min(hi, box[2 * k + 1]))])
+        elif hi - lo >= shape[k]:
+            seed.append([(0, shape[k])])
+        else:  # the box wraps along this axis: bring the seed back into [0, shape)
+            seed.append([(max(lo, 0), min(hi, shape[k]))] + ([(lo + shape[k], shape[k])] if lo < 0 else [])
+                        + ([(0, hi - shape[k])] if hi > shape[k] else []))
+    return seed
+
+
+def _volume(box):
+    return (box[1] - box[0]) * (box[3] - box[2]) * (box[5] - box[4])
+
+
+def incremental_catalog(df_orig, orig_file, dec_file, dims, rho=DEFAULT_RHO, block=DEFAULT_DIFF_BLOCK,
+                        margin=DEFAULT_MARGIN, max_fraction=DEFAULT_MAX_FRACTION, workers=None):
+    """Decompressed-field catalog spliced from df_orig; returns (df or None, info)."""
+    shape = tuple(int(d) for d in reversed(dims))
+    dirty, (thr_o, thr_d) = changed_blocks(orig_file, dec_file, dims, rho, block, workers)
+    regions = dirty_regions(dirty, block, shape, margin)
+    budget = max_fraction * float(np.prod(shape))
+    info = {"dirty_blocks": int(dirty.sum()), "blocks": int(dirty.size), "regions": len(regions), "grown": 0,
+            "fraction": sum(_volume(b) for b, _ in regions) / float(np.prod(shape))}
+    if info["fraction"] > max_fraction:
+        return None, info
+
+    drop, parts, volume = set(), [], 0  # overlapping boxes count twice: it is labeling work
+    for box, inner in regions:
+        m = margin
+        while True:
+            seed = seed_intervals(inner, box, shape)
+            found_o = find_halos(orig_file, dims, rho=thr_o, absolute=True, workers=workers, box=box, seed=seed)
+            found_d = find_halos(dec_file, dims, rho=thr_d, absolute=True, workers=workers, box=box, seed=seed)
+            if not ((found_o["seed"] & found_o["edge"]).any() or (found_d["seed"] & found_d["edge"]).any()):
+                break
+            m = 2 * m if m else block
+            box = grow_box(inner, m, shape)
+            info["grown"] += 1
+            if volume + _volume(box) > budget:
+                info["fraction"] = (volume + _volume(box)) / float(np.prod(shape))
+                return None, info
+        volume += _volume(box)
+        drop.update(found_o["id"][found_o["seed"]].tolist())
+        parts.append(found_d[found_d["seed"]][CATALOG_COLUMNS])
+    info["fraction"] = volume / float(np.prod(shape))
+    kept = df_orig[~df_orig["id"].isin(drop)][CATALOG_COLUMNS]
+    # a halo next to two inner boxes is found complete from both: same peak, same id
+    found = pd.concat(parts, ignore_index=True).drop_duplicates("id")
+    return pd.concat([kept, found], ignore_index=True), info
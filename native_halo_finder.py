@@ -0,0 +1,270 @@
+"""In-process halo finder: threshold + connected-component labeling with NumPy/SciPy.
+
+Stand-in for reeber's amr_connected_components_float run as
+`-b 128 -n -w`: halos are the face-connected components of the superlevel
+set {rho > threshold} of the field, with threshold = rho_factor * mean(field),
+or rho_factor itself when absolute=True. Periodic wrap is on by default.
+Each halo reports the same columns as the reeber text output:
+
+    id      linear index of the halo's maximum cell
+    x y z   cell coordinates of that maximum (x is the fastest-varying axis)
+    n_cell  number of cells in the component
+    n_vert  same as n_cell (uniform grid: one vertex per cell)
+    mass    sum of the field over the component
+
+The field is read through np.memmap and processed in block^3 blocks on a
+process pool. Each block is labeled locally, and labels touching across
+block faces (and across the periodic boundary) are merged with a sparse
+connected-components pass, so no worker ever holds more than one block.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+import pandas as pd
+from scipy import ndimage
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+DEFAULT_RHO = 81.66
+DEFAULT_BLOCK = 128
+NATIVE_VERSION = 2  # bump when the algorithm changes (part of the halo cache key)
+CATALOG_COLUMNS = ["id", "x", "y", "z", "n_cell", "n_vert", "mass"]
+_pool = None  # set by shared_pool(); find_halos reuses it instead of starting a pool per call
+# peak bytes per cell while labeling a block: data, mask, int32 labels, index/value temporaries
+BLOCK_BYTES_PER_CELL = 32
+
+
+def block_slices(shape, block, origin=(0, 0, 0)):
+    """[(z0, z1, y0, y1, x0, x1), ...] covering shape (offset by origin) in C order, plus the block-grid shape."""
+    grid = tuple(-(-n // block) for n in shape)
+    oz, oy, ox = origin
+    out = []
+    for bz in range(grid[0]):
+        for by in range(grid[1]):
+            for bx in range(grid[2]):
+                out.append((oz + bz * block, oz + min((bz + 1) * block, shape[0]),
+                            oy + by * block, oy + min((by + 1) * block, shape[1]),
+                            ox + bx * block, ox + min((bx + 1) * block, shape[2])))
+    return out, grid
+
+
+def process_pool(workers=None, forkserver=False):
+    """ProcessPoolExecutor that never forks a process with other Python threads running.
+
+    find_halos also runs inside run_halo_pair's threads; forking then can
+    deadlock the child on a lock another thread held (pandas, h5py, imports).
+    There, and with forkserver=True (long-lived pools, where the ~1 s server
+    start is paid once), workers come from a single-threaded forkserver that
+    has __main__ and this module loaded (spawn where there is no forkserver).
+    A single-threaded caller keeps plain fork, which starts in milliseconds.
+    """
+    ctx = None
+    if forkserver or threading.active_count() > 1:
+        if "forkserver" in multiprocessing.get_all_start_methods():
+            ctx = multiprocessing.get_context("forkserver")
+            ctx.set_forkserver_preload(["__main__", __name__])
+        else:
+            ctx = multiprocessing.get_context("spawn")
+    return ProcessPoolExecutor(max_workers=workers or os.cpu_count() or 1, mp_context=ctx)
+
+
+def workers_within(max_memory_mb, workers, block=DEFAULT_BLOCK):
+    """Cap the pool size so concurrently labeled blocks fit in max_memory_mb."""
+    per_worker = block ** 3 * BLOCK_BYTES_PER_CELL
+    return max(1, min(workers, int(max_memory_mb * 2 ** 20 // per_worker)))
+
+
+@contextmanager
+def shared_pool(workers=None):
+    """Keep one process pool for every find_halos call in the block (batch runs)."""
+    global _pool
+    with process_pool(workers, forkserver=True) as pool:
+        _pool = pool
+        try:
+            yield pool
+        finally:
+            _pool = None
+
+
+def open_field(path, shape):
+    return np.memmap(path, dtype=np.float32, mode="r", shape=shape)
+
+
+def read_block(path, shape, bounds):
+    """Cells (z0, z1, y0, y1, x0, x1) of the field; bounds outside the field wrap around periodically."""
+    z0, z1, y0, y1, x0, x1 = bounds
+    field = open_field(path, shape)
+    if all(0 <= bounds[2 * k] and bounds[2 * k + 1] <= shape[k] for k in range(3)):
+        return np.asarray(field[z0:z1, y0:y1, x0:x1])
+    return field[np.ix_(np.arange(z0, z1) % shape[0], np.arange(y0, y1) % shape[1], np.arange(x0, x1) % shape[2])]
+
+
+def block_sum(task):
+    path, shape, bounds = task
+    return float(read_block(path, shape, bounds).sum(dtype=np.float64))
+
+
+def _sparse_face(face):
+    """(flat indices, labels) of the labeled cells of one block face."""
+    idx = np.flatnonzero(face).astype(np.int32)
+    return idx, face.ravel()[idx]
+
+
+def _seed_labels(labels, bounds, seed, n):
+    """Boolean per label (1..n): does it have a cell inside seed (per-axis lists of [lo, hi) intervals)?"""
+    hit = np.zeros(n + 1, dtype=bool)
+    spans = []
+    for k in range(3):
+        lo, hi = bounds[2 * k], bounds[2 * k + 1]
+        spans.append([slice(max(a, lo) - lo, min(b, hi) - lo) for a, b in seed[k] if a < hi and b > lo])
+    for sz in spans[0]:
+        for sy in spans[1]:
+            for sx in spans[2]:
+                hit[labels[sz, sy, sx]] = True
+    return hit[1:]
+
+
+def _label_block(task):
+    """Label one block; return per-label stats and the labeled cells of its six boundary faces.
+
+    Faces are sparse (see _sparse_face): only cells above the threshold are
+    kept, so the parent holds O(labeled surface) per block, not six full faces.
+    Among equal maxima the cell with the largest whole-field linear index is
+    the peak, so ids do not depend on the block layout.
+    """
+    path, shape, (z0, z1, y0, y1, x0, x1), threshold, seed = task
+    data = read_block(path, shape, (z0, z1, y0, y1, x0, x1))
+    labels, n = ndimage.label(data > threshold)
+    stats = {"n": n}
+    if n:
+        lab = labels.ravel()
+        sel = np.flatnonzero(lab)
+        lab, vals = lab[sel], data.ravel()[sel]
+        stats["count"] = np.bincount(lab, minlength=n + 1)[1:]
+        stats["mass"] = np.bincount(lab, weights=vals.astype(np.float64), minlength=n + 1)[1:]
+        # position of the max of each label: last element per label after sorting by (label, value)
+        bounds = (z0, z1, y0, y1, x0, x1)
+        if all(0 <= bounds[2 * k] and bounds[2 * k + 1] <= shape[k] for k in range(3)):
+            order = np.lexsort((vals, lab))  # local C order is whole-field order
+        else:  # the block wraps around the field edge
+            gz, gy, gx = np.unravel_index(sel, labels.shape)
+            gid = np.ravel_multi_index(((gz + z0) % shape[0], (gy + y0) % shape[1], (gx + x0) % shape[2]), shape)
+            order = np.lexsort((gid, vals, lab))
+        last = order[np.r_[np.flatnonzero(np.diff(lab[order])), len(order) - 1]]
+        lz, ly, lx = np.unravel_index(sel[last], labels.shape)
+        stats["peak"] = vals[last].astype(np.float64)
+        stats["pos"] = np.stack([(lz + z0) % shape[0], (ly + y0) % shape[1], (lx + x0) % shape[2]], axis=1)
+        if seed is not None:
+            stats["seed"] = _seed_labels(labels, bounds, seed, n)
+    faces = [_sparse_face(f) for f in (labels[0], labels[-1], labels[:, 0], labels[:, -1],
+                                       labels[:, :, 0], labels[:, :, -1])]
+    return stats, faces
+
+
+def find_halos(binary_file, dims, rho=DEFAULT_RHO, absolute=False, block=DEFAULT_BLOCK, wrap=True, workers=None,
+               box=None, seed=None):
+    """Halo catalog (DataFrame with CATALOG_COLUMNS) of a raw float32 field with the given dims.
+
+    box=(z0, z1, y0, y1, x0, x1) restricts the search to that sub-volume (a
+    relative threshold then uses the box mean). Bounds outside the field
+    continue periodically across its edge; wrap only applies along the axes
+    the box spans completely. Positions and ids stay in whole-field
+    coordinates.
+
+    With seed (per axis, a list of [lo, hi) intervals in the coordinates of
+    box) two boolean columns are added: "seed", the halo has a cell inside
+    seed, and "edge", the halo touches a face of box that does not wrap, so
+    it may continue outside the box and be truncated.
+    """
+    shape = tuple(int(d) for d in reversed(dims))
+    if box is None:
+        slices, grid = block_slices(shape, block)
+        wrap = (wrap,) * 3
+    else:
+        z0, z1, y0, y1, x0, x1 = box
+        slices, grid = block_slices((z1 - z0, y1 - y0, x1 - x0), block, origin=(z0, y0, x0))
+        wrap = tuple(wrap and box[2 * k] == 0 and box[2 * k + 1] == shape[k] for k in range(3))
+    workers = workers or os.cpu_count() or 1
+    with nullcontext(_pool) if _pool is not None else process_pool(workers) as pool:
+        if absolute:
+            threshold = rho
+        else:
+            total = sum(pool.map(block_sum, [(binary_file, shape, s) for s in slices]))
+            threshold = rho * total / float(np.prod(shape))
+        results = list(pool.map(_label_block, [(binary_file, shape, s, threshold, seed) for s in slices],
+                                chunksize=max(1, len(slices) // (4 * workers))))
+
+    offsets = np.cumsum([0] + [r[0]["n"] for r in results])
+    n_total = int(offsets[-1])
+    if n_total == 0:
+        df = pd.DataFrame({c: np.empty(0, dtype=np.float64 if c == "mass" else np.int64) for c in CATALOG_COLUMNS})
+        if seed is not None:
+            df["seed"] = df["edge"] = np.empty(0, dtype=bool)
+        return df
+
+    # union labels that touch across block faces: face 2k+1 (high side) of a block meets
+    # face 2k (low side) of its neighbour along axis k
+    pairs_a, pairs_b = [], []
+    for b, (_, faces) in enumerate(results):
+        bidx = np.unravel_index(b, grid)
+        for axis in range(3):
+            nb = list(bidx)
+            nb[axis] += 1
+            if nb[axis] == grid[axis]:
+                if not wrap[axis]:
+                    continue
+                nb[axis] = 0
+            nb_id = int(np.ravel_multi_index(nb, grid))
+            (hi_idx, hi_lab), (lo_idx, lo_lab) = faces[2 * axis + 1], results[nb_id][1][2 * axis]
+            # neighbouring faces have the same extent, so equal flat indices are facing cells
+            _, i, j = np.intersect1d(hi_idx, lo_idx, assume_unique=True, return_indices=True)
+            if len(i):
+                pairs_a.append(hi_lab[i].astype(np.int64) - 1 + offsets[b])
+                pairs_b.append(lo_lab[j].astype(np.int64) - 1 + offsets[nb_id])
+    if pairs_a:
+        a, b = np.concatenate(pairs_a), np.concatenate(pairs_b)
+        graph = coo_matrix((np.ones(len(a), dtype=np.int8), (a, b)), shape=(n_total, n_total))
+        n_halo, comp = connected_components(graph, directed=False)
+    else:
+        n_halo, comp = n_total, np.arange(n_total)
+
+    stats = [r[0] for r in results if r[0]["n"]]
+    count = np.concatenate([s["count"] for s in stats])
+    mass = np.concatenate([s["mass"] for s in stats])
+    peak = np.concatenate([s["peak"] for s in stats])
+    pos = np.concatenate([s["pos"] for s in stats])
+
+    n_cell = np.bincount(comp, weights=count, minlength=n_halo).astype(np.int64)
+    halo_mass = np.bincount(comp, weights=mass, minlength=n_halo)
+    ids = np.ravel_multi_index(pos.T, shape).astype(np.int64)
+    order = np.lexsort((ids, peak, comp))
+    best = order[np.r_[np.flatnonzero(np.diff(comp[order])), len(order) - 1]]
+    zyx = pos[best]
+    df = pd.DataFrame({
+        "id": ids[best],
+        "x": zyx[:, 2].astype(np.int64),
+        "y": zyx[:, 1].astype(np.int64),
+        "z": zyx[:, 0].astype(np.int64),
+        "n_cell": n_cell,
+        "n_vert": n_cell,
+        "mass": halo_mass,
+    })
+    if seed is not None:
+        hit = np.concatenate([s["seed"] for s in stats])
+        df["seed"] = np.bincount(comp, weights=hit, minlength=n_halo) > 0
+        edge = np.zeros(n_halo, dtype=bool)
+        cut = [box is not None and (box[2 * k], box[2 * k + 1]) != (0, shape[k]) for k in range(3)]
+        for b, (_, faces) in enumerate(results):
+            bidx = np.unravel_index(b, grid)
+            for axis in range(3):
+                if not cut[axis]:
+                    continue
+                for side, at in ((2 * axis, 0), (2 * axis + 1, grid[axis] - 1)):
+                    if bidx[axis] == at and len(faces[side][1]):
+                        edge[comp[faces[side][1].astype(np.int64) - 1 + offsets[b]]] = True
+        df["edge"] = edge
+    return df
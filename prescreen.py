@@ -0,0 +1,98 @@
+"""Cheap pre-screen of a decompressed field before the halo finder runs.
+
+Two streamed passes over both raw fields (field_io tiles, so memory stays
+bounded) compute the halo thresholds (rho x mean of each field, as
+native_halo_finder does) and then:
+
+    n_flip           cells above the threshold in one field but not the other
+    max_error_above  max |orig - dec| over cells above the threshold in either field
+    max_error        max |orig - dec| over the whole field
+
+Decisions:
+    exact   no flips and max_error_above == 0: the superlevel sets and every
+            value in them are identical, so the decompressed catalog *is* the
+            original catalog and only the (cached) original run is needed
+    reject  flip_fraction (n_flip / cells above the original threshold) or
+            max_error_above / threshold over the configured bound: the point
+            is reported as failed without running the halo finder
+    full    anything else: run the normal analysis
+"""
+import json
+import math
+import os
+import time
+
+import numpy as np
+
+from field_io import DEFAULT_MAX_MEMORY_MB, iter_slabs
+
+PRESCREEN_FILE = "prescreen.json"
+DEFAULT_MAX_FLIP_FRACTION = 0.1
+DEFAULT_MAX_ERROR = math.inf  # relative to the original threshold; inf disables the check
+
+
+def _field_thresholds(orig_file, dec_file, dims, rho, block, max_memory_mb):
+    total_o = total_d = 0.0
+    n = 0
+    for (_, tile_o), (_, tile_d) in zip(iter_slabs(orig_file, dims, block, max_memory_mb // 2),
+                                        iter_slabs(dec_file, dims, block, max_memory_mb // 2)):
+        total_o += float(tile_o.sum(dtype=np.float64))
+        total_d += float(tile_d.sum(dtype=np.float64))
+        n += tile_o.size
+    return rho * total_o / n, rho * total_d / n, n
+
+
+def field_stats(orig_file, dec_file, dims, rho, block=128, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+    """Threshold-crossing and error statistics of dec_file against orig_file."""
+    thr_o, thr_d, n = _field_thresholds(orig_file, dec_file, dims, rho, block, max_memory_mb)
+    n_above = n_flip = 0
+    max_err = max_err_above = 0.0
+    for (_, a), (_, b) in zip(iter_slabs(orig_file, dims, block, max_memory_mb // 2),
+                              iter_slabs(dec_file, dims, block, max_memory_mb // 2)):
+        above_o, above_d = a > thr_o, b > thr_d
+        err = np.abs(a - b)
+        n_above += int(np.count_nonzero(above_o))
+        n_flip += int(np.count_nonzero(above_o != above_d))
+        max_err = max(max_err, float(err.max()))
+        either = above_o | above_d
+        if either.any():
+            max_err_above = max(max_err_above, float(err[either].max()))
+    return {"n_cells": n, "n_above": n_above, "n_flip": n_flip,
+            "flip_fraction": n_flip / n_above if n_above else float(n_flip > 0),
+            "max_error": max_err, "max_error_above": max_err_above,
+            "threshold_orig": thr_o, "threshold_dec": thr_d}
+
+
+def decide(stats, max_flip_fraction=DEFAULT_MAX_FLIP_FRACTION, max_error=DEFAULT_MAX_ERROR):
+    """('exact' | 'reject' | 'full', reason) for field_stats() output."""
+    if stats["n_flip"] == 0 and stats["max_error_above"] == 0.0:
+        return "exact", "identical above the halo threshold"
+    if stats["flip_fraction"] > max_flip_fraction:
+        return "reject", f"flip_fraction {stats['flip_fraction']:.3g} > {max_flip_fraction:g}"
+    rel_err = stats["max_error_above"] / stats["threshold_orig"] if stats["threshold_orig"] else math.inf
+    if rel_err > max_error:
+        return "reject", f"max_error_above / threshold {rel_err:.3g} > {max_error:g}"
+    return "full", "within bounds"
+
+
+def prescreen(orig_file, dec_file, dims, rho, out_dir, max_flip_fraction=DEFAULT_MAX_FLIP_FRACTION,
+              max_error=DEFAULT_MAX_ERROR, block=128, max_memory_mb=DEFAULT_MAX_MEMORY_MB):
+    """Run field_stats + decide and record the result in out_dir/PRESCREEN_FILE."""
+    start = time.perf_counter()
+    stats = field_stats(orig_file, dec_file, dims, rho, block, max_memory_mb)
+    decision, reason = decide(stats, max_flip_fraction, max_error)
+    record = {"decision": decision, "reason": reason, **stats, "max_flip_fraction": max_flip_fraction,
+              "max_error_bound": max_error if math.isfinite(max_error) else None,
+              "seconds": time.perf_counter() - start}
+    with open(os.path.join(out_dir, PRESCREEN_FILE), "w") as f:
+        json.dump(record, f)
+    return record
+
+
+def load_prescreen(out_dir):
+    """The prescreen record saved in out_dir, or None when no pre-screen ran."""
+    path = os.path.join(out_dir, PRESCREEN_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
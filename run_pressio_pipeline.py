@@ -1,14 +1,28 @@
 #!/usr/bin/env python3
 import argparse
+import atexit
 import subprocess
 import sys
 import os
 import json
+import re
+import shutil
+import tempfile
+import uuid
 import numpy as np
 
+from halo_daemon import DEFAULT_SOCKET, run_via_daemon
+import halo_trace
+from halo_trace import stage
+from field_io import DEFAULT_MAX_MEMORY_MB
+from halo_metrics import ARRAY_NAMES, OPTIONAL_ARRAY_NAMES, SUMMARY_KEYS, summarize
+from prescreen import DEFAULT_MAX_ERROR, DEFAULT_MAX_FLIP_FRACTION, PRESCREEN_FILE, load_prescreen
+
 # ------------ Command-line args ------------
 parser = argparse.ArgumentParser(description="Pipeline: as external cmd delegates to halo_dual_pressio; as top-level runs pressio")
 parser.add_argument("--external_mode", action="store_true")
+parser.add_argument("--run_pressio", action="store_true",
+                    help="Top-level: run pressio on --input with external:command pointing back at this script")
 parser.add_argument("--input", help="Input path")
 parser.add_argument("--decompressed", help="Decompressed path (LibPressio injects when calling us as external)")
 parser.add_argument("--original_input", help="Original input path (HDF5/.f32); pass in external:command")
@@ -18,9 +32,41 @@ parser.add_argument("--compressor", default="sz3", help="Compressor name for pre
 parser.add_argument("--halo_exe", default="/home/ziweiq2/halo/reeber/build/examples/amr-connected-components/amr_connected_components_float", help="Path to halo executable")
 parser.add_argument("--external_script", default="/home/ziweiq2/halo/halo_dual_pressio.py", help="Path to halo_dual_pressio.py")
 parser.add_argument("--pressio", default="pressio", help="Pressio command (default: pressio)")
+parser.add_argument("--parallel", action="store_true", help="Run the original/decompressed halo analyses concurrently")
+parser.add_argument("--periodic", action="store_true", help="Periodic halo matching in the dims box")
+parser.add_argument("--mutual_match", action="store_true", help="One-to-one (mutual nearest neighbour) halo matching")
+parser.add_argument("--halo_backend", choices=["reeber", "native"], default="reeber",
+                    help="reeber: --halo_exe; native: in-process NumPy/SciPy halo finder (no external build)")
+parser.add_argument("--incremental", action="store_true",
+                    help="Re-analyse only the changed blocks of the decompressed field (needs --halo_backend native)")
+parser.add_argument("--prescreen", action="store_true",
+                    help="Pre-screen the raw fields before the halo finder (exact short-cut / early reject)")
+parser.add_argument("--prescreen_max_flip_fraction", type=float, default=DEFAULT_MAX_FLIP_FRACTION,
+                    help="Reject when this fraction of above-threshold cells crosses the threshold")
+parser.add_argument("--prescreen_max_error", type=float, default=DEFAULT_MAX_ERROR,
+                    help="Reject when the max error above the threshold exceeds this multiple of it (default: off)")
+parser.add_argument("--max_memory_mb", type=int, default=DEFAULT_MAX_MEMORY_MB,
+                    help="Resident memory budget of the halo analysis (env HALO_MAX_MEMORY_MB)")
+parser.add_argument("--transport", choices=["json", "compact"], default="json",
+                    help="json: full arrays as JSON lists on stdout; compact: summary metrics + paths to the memory-mapped .npy arrays")
+parser.add_argument("--eval_uuid", help="Evaluation id; scopes the workspace (default: a fresh uuid4)")
+parser.add_argument("--workspace_root", default=os.environ.get("HALO_WORKSPACE_ROOT", os.path.join(tempfile.gettempdir(), "halo_workspaces")),
+                    help="Parent directory of the per-evaluation workspaces (env HALO_WORKSPACE_ROOT)")
+parser.add_argument("--keep_workspace", action="store_true",
+                    help="Keep the evaluation workspace; the caller deletes it (compact records only carry .npy paths then)")
+parser.add_argument("--trace_dir", default=os.environ.get("HALO_TRACE_DIR"),
+                    help="Per-stage timing/memory JSONL per eval_uuid, also for halo_dual_pressio (env HALO_TRACE_DIR)")
+parser.add_argument("--daemon_socket", default=DEFAULT_SOCKET, help="halo_daemon.py socket (env HALO_DAEMON_SOCKET)")
+parser.add_argument("--no_daemon", action="store_true", help="Always spawn halo_dual_pressio.py instead of using a running halo_daemon")
 # Use parse_known_args to ignore LibPressio's additional arguments (--api, --input, --decompressed, etc.)
 args, unknown = parser.parse_known_args()
 
+# boolean options forwarded unchanged to halo_dual_pressio.py
+HALO_FLAGS_PASSTHROUGH = ["parallel", "periodic", "mutual_match", "incremental", "prescreen"]
+# valued options forwarded as --name value
+HALO_OPTIONS_PASSTHROUGH = ["halo_backend", "max_memory_mb", "prescreen_max_flip_fraction", "prescreen_max_error",
+                            "trace_dir"]
+
 # ------------ Dataset & Paths ------------
 input_file = args.input
 dims = args.dim or []
@@ -31,46 +77,159 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 external_script = args.external_script if os.path.isabs(args.external_script) else os.path.join(script_dir, args.external_script)
 pressio = args.pressio
 original_input = args.original_input or args.input
+eval_uuid = args.eval_uuid or uuid.uuid4().hex
+workspace = os.path.join(os.path.abspath(args.workspace_root), f"eval_{eval_uuid}")
+# workspace 在进程退出时删除（成功、失败、异常都一样）；--keep_workspace 时交给调用方清理，
+# compact 输出里的 .npy 路径也只在这种情况下给出
+keep_workspace = args.keep_workspace
+if args.trace_dir:
+    args.trace_dir = os.path.abspath(args.trace_dir)  # forwarded to processes with other working dirs
+halo_trace.configure(args.trace_dir, eval_uuid, "pipeline_external" if args.decompressed else "pipeline")
+
+def load_arrays(out_dir):
+    """Memory-map dists/mass_orig/mass_dec(/dists_rev) .npy from out_dir; None for any that is missing."""
+    arrays = {}
+    for name in ARRAY_NAMES + OPTIONAL_ARRAY_NAMES:
+        path = os.path.join(out_dir, f"{name}.npy")
+        arrays[name] = np.load(path, mmap_mode="r") if os.path.exists(path) else None
+    return arrays
+
+
+def remove_workspace(path):
+    """Atomically retire a workspace (rename away, then delete) so readers never see a half-deleted dir."""
+    if not os.path.isdir(path):
+        return
+    trash = f"{path}.trash-{os.getpid()}"
+    try:
+        os.rename(path, trash)
+    except OSError:
+        return
+    shutil.rmtree(trash, ignore_errors=True)
+
+
+if not keep_workspace:
+    atexit.register(remove_workspace, workspace)
+
+
+def parse_compression_ratio(pressio_stdout):
+    """Pick size:compression_ratio out of `pressio -M all` output; None if absent."""
+    m = re.search(r"size:compression_ratio\s*(?:<[^>]*>)?\s*=\s*([-+0-9.eEinfa]+)", pressio_stdout)
+    try:
+        return float(m.group(1)) if m else None
+    except ValueError:
+        return None
+
+
+def rejected(screen):
+    return screen is not None and screen["decision"] == "reject"
+
+
+def json_list(a):
+    """a as a JSON-ready list; unmatched halos have inf distances and JSON has no inf, so those go out as null."""
+    a = np.asarray(a)
+    finite = np.isfinite(a)
+    if finite.all():
+        return a.tolist()
+    out = a.astype(object)
+    out[~finite] = None
+    return out.tolist()
+
+
+def emit_arrays(arrays, out_dir, transport, extra=None, screen=None):
+    """Print the libpressio external JSON record for the halo arrays (and the prescreen decision, if any).
+
+    Compact records carry the .npy paths under out_dir; out_dir=None (the
+    workspace is deleted on exit) leaves them out.
+    """
+    print("external:api=json:1", file=sys.stdout, flush=True)
+    if rejected(screen):
+        # halo finder skipped: metrics unknown (null), consumers count the point as failed. Not empty
+        # arrays in the json transport: libpressio consumers read those as "no error", a perfect point
+        metrics = {k: None for k in SUMMARY_KEYS}
+        if transport == "json":
+            metrics.update({name: None for name in ARRAY_NAMES})
+    elif transport == "compact":
+        metrics = summarize(arrays["dists"], arrays["mass_orig"], arrays["mass_dec"], arrays.get("dists_rev"))
+        # inf (halos found in only one catalog) is not valid JSON either: null, which consumers count as failed
+        metrics = {k: v if np.isfinite(v) else None for k, v in metrics.items()}
+        metrics["n_halos"] = int(np.isfinite(arrays["dists"]).sum())
+        if arrays.get("n_halos") is not None:
+            metrics["n_halos_orig"], metrics["n_halos_dec"] = (int(n) for n in arrays["n_halos"])
+        if out_dir is not None:
+            for name in ARRAY_NAMES:
+                metrics[f"{name}_path"] = os.path.join(out_dir, f"{name}.npy")
+    else:
+        metrics = {name: json_list(arrays[name]) for name in ARRAY_NAMES}
+    if screen is not None:
+        metrics["prescreen"] = screen["decision"]
+        metrics["prescreen_flip_fraction"] = screen["flip_fraction"]
+        metrics["prescreen_max_error_above"] = screen["max_error_above"]
+        if transport == "compact" and out_dir is not None:
+            metrics["prescreen_path"] = os.path.join(out_dir, PRESCREEN_FILE)
+    if extra:
+        metrics.update(extra)
+    print(json.dumps(metrics), file=sys.stdout, flush=True)
+
 
 # ------------ 被 LibPressio 作为 external 调用 -> 转给 halo_dual_pressio，只输出 dists 等 ------------
 # 首次 launch（probe）无 --decompressed，输出默认格式避免 return 1
-if not args.decompressed:
+if not args.decompressed and not args.run_pressio:
     print("external:api=json:1")
     print(json.dumps({"dists": []}))
     sys.exit(0)
 
 if args.decompressed:
     halo_cmd = [sys.executable, external_script, "--input", args.input, "--decompressed", args.decompressed,
-                "--external_exe", halo_exe, "--original_input", original_input or args.input]
+                "--external_exe", halo_exe, "--original_input", original_input or args.input,
+                "--eval_uuid", eval_uuid, "--workdir", workspace]
     for d in dims:
         halo_cmd.extend(["--dim", str(d)])
-    result = subprocess.run(halo_cmd, capture_output=True, text=True)
+    for flag in HALO_FLAGS_PASSTHROUGH:
+        if getattr(args, flag):
+            halo_cmd.append(f"--{flag}")
+    for opt in HALO_OPTIONS_PASSTHROUGH:
+        if getattr(args, opt) is not None:
+            halo_cmd.extend([f"--{opt}", str(getattr(args, opt))])
+    # 有 halo_daemon 在跑就交给它（省掉解释器启动和重型 import），否则照旧起子进程
+    with stage("halo_dual_pressio") as trace:
+        resp = None if args.no_daemon else run_via_daemon(external_script, halo_cmd[2:], args.daemon_socket)
+        trace["daemon"] = resp is not None
+        if resp is not None:
+            result = subprocess.CompletedProcess(halo_cmd, resp["returncode"], resp["stdout"], resp["stderr"])
+        else:
+            result = subprocess.run(halo_cmd, capture_output=True, text=True)
     if result.stderr:
         sys.stderr.write(result.stderr)
     if result.returncode != 0:
         sys.exit(result.returncode)
-    # 读取 halo_dual_pressio 保存的 .npy，输出 LibPressio 格式
-    out_dir = os.path.dirname(os.path.abspath(external_script))
-    dists_path = os.path.join(out_dir, "dists.npy")
-    mass_orig_path = os.path.join(out_dir, "mass_orig.npy")
-    mass_dec_path = os.path.join(out_dir, "mass_dec.npy")
-    if not os.path.exists(dists_path) or not os.path.exists(mass_orig_path) or not os.path.exists(mass_dec_path):
-        print(f"[run_pressio_pipeline] missing .npy in {out_dir}", file=sys.stderr)
+    # 读取 halo_dual_pressio 保存在 workspace 里的 .npy（mmap），输出 LibPressio 格式
+    arrays = load_arrays(workspace)
+    screen = load_prescreen(workspace)
+    if not rejected(screen) and any(arrays[name] is None for name in ARRAY_NAMES):
+        print(f"[run_pressio_pipeline] missing .npy in {workspace}", file=sys.stderr)
         print("external:api=json:1")
         print(json.dumps({"dists": []}))
         sys.exit(1)
-    dists = np.load(dists_path)
-    mass_orig = np.load(mass_orig_path)
-    mass_dec = np.load(mass_dec_path)
-    print("external:api=json:1")
-    print(json.dumps({"dists": dists.tolist(), "mass_orig": mass_orig.tolist(), "mass_dec": mass_dec.tolist()}))
+    with stage("emit", transport=args.transport):
+        emit_arrays(arrays, workspace if keep_workspace else None, args.transport, screen=screen)
     sys.exit(0)
 
 # ------------ Top-level: 运行 pressio，external:command 指向自己 ------------
-if args.external_mode and input_file and len(dims) >= 3:
+# （external 调用也带 --external_mode，所以顶层模式用单独的 --run_pressio 触发）
+if args.run_pressio and input_file and len(dims) >= 3:
     # Run Pressio and capture output
     pipeline_path = os.path.abspath(__file__)
     ext_cmd = f"python {pipeline_path} --external_mode --original_input {original_input}"
+    ext_cmd += f" --halo_exe {halo_exe} --external_script {external_script}"
+    for flag in HALO_FLAGS_PASSTHROUGH:
+        if getattr(args, flag):
+            ext_cmd += f" --{flag}"
+    for opt in HALO_OPTIONS_PASSTHROUGH:
+        if getattr(args, opt) is not None:
+            ext_cmd += f" --{opt} {getattr(args, opt)}"
+    ext_cmd += f" --transport {args.transport}"
+    # 外层读取结果，所以 external 调用保留 workspace，由外层清理
+    ext_cmd += f" --eval_uuid {eval_uuid} --workspace_root {os.path.abspath(args.workspace_root)} --keep_workspace"
     pressio_cmd = [
         pressio,
         "-i", input_file,
@@ -85,8 +244,9 @@ if args.external_mode and input_file and len(dims) >= 3:
     ]
     # print("Pressio command: ", pressio_cmd)
 
-    result = subprocess.run(pressio_cmd, capture_output=True, text=True)
-    
+    with stage("pressio", compressor=compressor, rel=rel):
+        result = subprocess.run(pressio_cmd, capture_output=True, text=True)
+
     # Debug: check pressio return code
     if result.returncode != 0:
         print(f"❌ Pressio command failed with return code {result.returncode}", file=sys.stderr)
@@ -104,59 +264,26 @@ if args.external_mode and input_file and len(dims) >= 3:
         print("data=0.0")
         sys.exit(0)
 
-    # ---- Now expect halo_metrics.csv to exist ----
-    if not os.path.exists("halo_metrics.csv"):
-        print("❌ Error: halo_metrics.csv was not created by the external script", file=sys.stderr)
-        print(f"Pressio stderr:\n{result.stderr}", file=sys.stderr)
-        # Output default metrics even on error (libpressio requires format)
-        print("external:api=1")
-        print("data=0.0")
-        sys.exit(1)
+    # ---- Read dists from this evaluation's workspace (halo_dual_pressio writes there) ----
+    arrays = load_arrays(workspace)
+    screen = load_prescreen(workspace)
+    for name in ARRAY_NAMES:
+        if arrays[name] is None and not rejected(screen):
+            print(f"❌ Error: {name}.npy was not created by the external script in {workspace}", file=sys.stderr)
+            print(f"Pressio stderr:\n{result.stderr}", file=sys.stderr)
+            print("external:api=json:1", file=sys.stdout, flush=True)
+            print(json.dumps({"dists": []}), file=sys.stdout, flush=True)
+            sys.exit(1)
 
-    # ---- Read dists from script dir (halo_dual_pressio writes there) ----
-    npy_dir = os.path.dirname(os.path.abspath(external_script))
-    dists_path = os.path.join(npy_dir, "dists.npy")
-    mass_orig_path = os.path.join(npy_dir, "mass_orig.npy")
-    mass_dec_path = os.path.join(npy_dir, "mass_dec.npy")
-    if not os.path.exists(dists_path):
-        print("❌ Error: dists.npy was not created by the external script", file=sys.stderr)
-        print(f"Pressio stderr:\n{result.stderr}", file=sys.stderr)
-        print("external:api=json:1", file=sys.stdout, flush=True)
-        print(json.dumps({"dists": []}), file=sys.stdout, flush=True)
-        sys.exit(1)
-    if not os.path.exists(mass_orig_path):
-        print("❌ Error: mass_orig.npy was not created by the external script", file=sys.stderr)
-        print(f"Pressio stderr:\n{result.stderr}", file=sys.stderr)
-        print("external:api=json:1", file=sys.stdout, flush=True)
-        print(json.dumps({"dists": []}), file=sys.stdout, flush=True)
-        sys.exit(1)
-    if not os.path.exists(mass_dec_path):
-        print("❌ Error: mass_dec.npy was not created by the external script", file=sys.stderr)
-        print(f"Pressio stderr:\n{result.stderr}", file=sys.stderr)
-        print("external:api=json:1", file=sys.stdout, flush=True)
-        print(json.dumps({"dists": []}), file=sys.stdout, flush=True)
-        sys.exit(1)
-
-    dists = np.load(dists_path)
-    mass_orig = np.load(mass_orig_path)
-    mass_dec = np.load(mass_dec_path)
-    # Convert numpy array to list for JSON serialization
-    dists_list = dists.tolist()
-    mass_orig_list = mass_orig.tolist()
-    mass_dec_list = mass_dec.tolist()
     # ---- Output in libpressio external metric format (JSON) ----
-    print("external:api=json:1", file=sys.stdout, flush=True)
-    # Output dists + mass + 3 lengths for inspection
-    metrics = {
-        "dists": dists_list,
-        "mass_orig": mass_orig_list,
-        "mass_dec": mass_dec_list,
-        # "len_dists": len(dists_list),
-        # "len_mass_orig": len(mass_orig_list),
-        # "len_mass_dec": len(mass_dec_list),
-    }
-    print(json.dumps(metrics), file=sys.stdout, flush=True)
+    extra = {"compressor": compressor, "rel": rel, "eval_uuid": eval_uuid}
+    cr = parse_compression_ratio(result.stdout)
+    if cr is not None:
+        extra["compression_ratio"] = cr
+    with stage("emit", transport=args.transport):
+        emit_arrays(arrays, workspace if keep_workspace else None, args.transport,
+                    extra if args.transport == "compact" else None, screen)
     sys.exit(0)
 
-# print("Usage: As external (LibPressio calls): needs --decompressed. As top-level: python run_pressio_pipeline.py --external_mode -i <file> -d 512 -d 512 -d 512", file=sys.stderr)
+# print("Usage: As external (LibPressio calls): needs --decompressed. As top-level: python run_pressio_pipeline.py --run_pressio --input <file> --dim 512 --dim 512 --dim 512", file=sys.stderr)
 sys.exit(1)
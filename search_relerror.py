@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Find the largest compression ratio whose halo metrics stay within a bound.
+
+Instead of sweeping a fixed rel grid, bisect over log(rel): halo quality gets
+worse and compression ratio grows with rel, so the answer is the largest rel
+that still meets every target. Evaluations go through
+sweep_relerror.evaluate_point and are memoized in the same checkpoint format,
+so points from earlier searches or sweeps of the same input and flags are
+reused for free.
+
+    python search_relerror.py --input field.f32 --dim 512 --dim 512 --dim 512 \
+        --target p99<=1.0 --target wasserstein<=20 --rel_lo 1e-8 --rel_hi 1e-4 \
+        --halo_exe <exe> --external_script halo_dual_pressio.py
+
+Unrecognized options are forwarded to run_pressio_pipeline.py.
+"""
+import argparse
+import json
+import math
+import os
+import re
+import sys
+
+from sweep_relerror import METRIC_COLUMNS, append_checkpoint, evaluate_point, load_checkpoint, point_key, run_context
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def parse_target(text):
+    """'p99<=1.5' -> ('p99', 1.5)."""
+    m = re.fullmatch(r"\s*(\w+)\s*<=?\s*([-+0-9.eE]+)\s*", text)
+    if not m or m.group(1) not in METRIC_COLUMNS:
+        raise argparse.ArgumentTypeError(f"bad target {text!r}; expected <metric><=<value> with metric in {METRIC_COLUMNS}")
+    return m.group(1), float(m.group(2))
+
+
+def feasible(row, targets):
+    return all(math.isfinite(float(row[k])) and float(row[k]) <= bound for k, bound in targets)
+
+
+class Evaluator:
+    """Memoized evaluate_point, persisted to a checkpoint JSONL.
+
+    Checkpoint rows are tagged with run_context (input file, dims, pipeline
+    flags) and only rows of the same context are reused. A point whose
+    evaluation fails counts as infeasible; it is not checkpointed, so a later
+    search retries it.
+    """
+
+    def __init__(self, compressor, input_file, dims, pipeline, extra_args, checkpoint):
+        self.compressor = compressor
+        self.input_file = input_file
+        self.dims = dims
+        self.pipeline = pipeline
+        self.extra_args = extra_args
+        self.checkpoint = checkpoint
+        self.context = run_context(input_file, dims, extra_args)
+        self.memo = {k: v for k, v in load_checkpoint(checkpoint, self.context).items()
+                     if v["compressor"] == compressor}
+        self.evaluations = 0
+
+    def __call__(self, rel):
+        key = point_key(self.compressor, rel)
+        if key not in self.memo:
+            self.evaluations += 1
+            try:
+                row = evaluate_point(self.compressor, rel, self.input_file, self.dims, self.pipeline,
+                                     self.extra_args)
+            except Exception as e:  # keep searching: a failed point is infeasible
+                print(f"[search] ❌ rel={rel:.4e}: {e}", file=sys.stderr)
+                row = {"rel_error": rel, "compression_ratio": float("nan"), "compressor": self.compressor,
+                       **{k: float("inf") for k in METRIC_COLUMNS}, "failed": True}
+            else:
+                row["context"] = self.context
+                append_checkpoint(self.checkpoint, row)
+            self.memo[key] = row
+            print(f"[search] rel={rel:.4e} cr={row['compression_ratio']:.3f} "
+                  + " ".join(f"{k}={row[k]:.4g}" for k in METRIC_COLUMNS), file=sys.stderr)
+        return self.memo[key]
+
+
+def search(evaluate, targets, rel_lo, rel_hi, rel_tol=0.05, max_evals=8):
+    """Bisect log(rel) for the largest feasible rel in [rel_lo, rel_hi].
+
+    Assumes quality degrades monotonically with rel. If it does not (noisy
+    metrics), the answer is still the feasible evaluated point with the best
+    compression ratio, never an infeasible one. Returns (best_row, rows).
+    """
+    rows = []
+
+    def probe(rel):
+        row = evaluate(rel)
+        rows.append(row)
+        return feasible(row, targets)
+
+    if probe(rel_hi):
+        lo = hi = rel_hi  # the whole bracket is feasible
+    elif not probe(rel_lo):
+        lo = hi = None  # nothing is feasible
+    else:
+        lo, hi = rel_lo, rel_hi
+        while hi / lo > 1.0 + rel_tol and len(rows) < max_evals:
+            mid = math.sqrt(lo * hi)
+            if probe(mid):
+                lo = mid
+            else:
+                hi = mid
+    good = [r for r in rows if feasible(r, targets)]
+    best = max(good, key=lambda r: (float(r["compression_ratio"]), float(r["rel_error"])), default=None)
+    return best, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Adaptive rel search under halo-quality bounds")
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--dim", type=int, action="append", required=True)
+    parser.add_argument("--compressor", default="sz3")
+    parser.add_argument("--target", type=parse_target, action="append", required=True,
+                        help="Quality bound, e.g. p99<=1.0 or wasserstein<=20 (repeatable, all must hold)")
+    parser.add_argument("--rel_lo", type=float, default=1e-8)
+    parser.add_argument("--rel_hi", type=float, default=1e-2)
+    parser.add_argument("--rel_tol", type=float, default=0.05, help="Stop when hi/lo < 1 + rel_tol")
+    parser.add_argument("--max_evals", type=int, default=8)
+    parser.add_argument("--checkpoint", default="search_checkpoint.jsonl", help="Memo of evaluated points (JSONL)")
+    parser.add_argument("--pipeline", default=os.path.join(SCRIPT_DIR, "run_pressio_pipeline.py"))
+    args, extra = parser.parse_known_args()
+
+    evaluate = Evaluator(args.compressor, args.input, args.dim, args.pipeline, extra, args.checkpoint)
+    best, rows = search(evaluate, args.target, args.rel_lo, args.rel_hi, args.rel_tol, args.max_evals)
+    print(f"[search] {len(rows)} points visited, {evaluate.evaluations} new evaluations", file=sys.stderr)
+    if best is None:
+        print(f"[search] no rel in [{args.rel_lo:g}, {args.rel_hi:g}] meets the targets", file=sys.stderr)
+        print(json.dumps({"feasible": False, "targets": dict(args.target)}))
+        sys.exit(1)
+    print(json.dumps({"feasible": True, "targets": dict(args.target), **best}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""Parallel, resumable rel-error sweep over run_pressio_pipeline.py.
+
+Every (compressor, rel) grid point is one top-level pipeline run in compact
+mode. Finished points are appended to a JSONL checkpoint, so an interrupted
+sweep picks up where it stopped. The summary CSV is updated as points finish,
+and the *_vs_relerror.png plots are regenerated at the end.
+
+    python sweep_relerror.py --input field.f32 --dim 512 --dim 512 --dim 512 \
+        --compressor sz3 --compressor zfp --rel_range 1e-7 6.15e-6 20 --workers 4 \
+        --halo_exe <amr_connected_components_float>
+
+Unrecognized options are forwarded to run_pressio_pipeline.py.
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+METRIC_COLUMNS = ["mean", "median", "p90", "p99", "p999", "wasserstein", "max", "p99_sym"]
+SUMMARY_COLUMNS = ["rel_error", "compression_ratio"] + METRIC_COLUMNS + ["compressor"]
+PLOT_LABELS = {
+    "compression_ratio": "Compression Ratio",
+    "mean": "Mean NN Distance",
+    "median": "Median NN Distance",
+    "p90": "90% NN Distance",
+    "p99": "99% NN Distance",
+    "p999": "99.9% NN Distance",
+    "max": "Max NN Distance",
+    "p99_sym": "99% NN Distance Symmetric",
+    "wasserstein": "Wasserstein Mass Distance",
+}
+
+
+def point_key(compressor, rel):
+    return f"{compressor}:{rel!r}"
+
+
+def run_context(input_file, dims, extra_args=()):
+    """Digest of what a point depends on besides (compressor, rel): the input file, dims and pipeline flags.
+
+    Stored with every checkpoint row, so a checkpoint shared by runs on other
+    inputs or with other flags is never mistaken for results of this one.
+    """
+    st = os.stat(input_file)
+    ident = [os.path.abspath(input_file), st.st_size, st.st_mtime_ns, [int(d) for d in dims], list(extra_args)]
+    return hashlib.sha256(json.dumps(ident).encode()).hexdigest()[:16]
+
+
+def parse_external_json(stdout):
+    """Return the JSON record that follows `external:api=json:1` in pipeline stdout."""
+    lines = stdout.splitlines()
+    for i, line in enumerate(lines):
+        if line.strip() == "external:api=json:1" and i + 1 < len(lines):
+            return json.loads(lines[i + 1])
+    raise ValueError("no external:api=json:1 record in pipeline output")
+
+
+def evaluate_point(compressor, rel, input_file, dims, pipeline=None, extra_args=(), keep_workspace=False):
+    """Run one compact top-level pipeline evaluation and return its summary row."""
+    pipeline = pipeline or os.path.join(SCRIPT_DIR, "run_pressio_pipeline.py")
+    cmd = [sys.executable, pipeline, "--run_pressio", "--transport", "compact",
+           "--input", input_file, "--compressor", compressor, "--rel", repr(rel)]
+    for d in dims:
+        cmd.extend(["--dim", str(d)])
+    cmd.extend(extra_args)
+    if keep_workspace:
+        cmd.append("--keep_workspace")  # otherwise the pipeline deletes it on exit, also when it fails
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"pipeline failed ({result.returncode}) for {compressor} rel={rel}:\n{result.stderr[-2000:]}")
+    record = parse_external_json(result.stdout)
+    if any(k not in record for k in METRIC_COLUMNS):
+        raise RuntimeError(f"pipeline returned no metrics for {compressor} rel={rel}: {record}")
+    row = {"rel_error": rel, "compression_ratio": record.get("compression_ratio", float("nan")),
+           "compressor": compressor}
+    for k in METRIC_COLUMNS:
+        # a prescreen reject or a lost catalog has no metrics (null): record it as infinitely bad, i.e. infeasible
+        row[k] = float("inf") if record[k] is None else record[k]
+    for k in ("prescreen", "n_halos_orig", "n_halos_dec"):
+        if k in record:
+            row[k] = record[k]
+    return row
+
+
+def load_checkpoint(path, context=None):
+    """Checkpoint rows by point_key; with a context, only the rows recorded under it."""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path) as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # torn last line from an interrupted run
+            if context is not None and rec.get("context") != context:
+                continue  # another input, dims or flag set
+            done[point_key(rec["compressor"], rec["rel_error"])] = rec
+    return done
+
+
+def append_checkpoint(path, row):
+    with open(path, "a") as f:
+        f.write(json.dumps(row) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _format_row(row):
+    return [row["compressor"] if c == "compressor" else f"{float(row[c]):.8e}" for c in SUMMARY_COLUMNS]
+
+
+def write_summary(path, rows):
+    """Rewrite the summary CSV from rows (sorted like metrics_summary.csv: rel descending)."""
+    rows = sorted(rows, key=lambda r: (r["compressor"], -float(r["rel_error"])))
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(SUMMARY_COLUMNS)
+        for row in rows:
+            w.writerow(_format_row(row))
+    os.replace(tmp, path)
+
+
+def has_rows(path):
+    """True if the CSV at path exists and has anything past its header line."""
+    if not os.path.exists(path):
+        return False
+    with open(path) as f:
+        return any(line.strip() for line in list(f)[1:])
+
+
+def backup(path):
+    """Move path aside to the first free <path>.bak[N]; returns the new name."""
+    dest, n = f"{path}.bak", 0
+    while os.path.exists(dest):
+        n += 1
+        dest = f"{path}.bak{n}"
+    os.replace(path, dest)
+    return dest
+
+
+def append_summary(path, row):
+    with open(path, "a", newline="") as f:
+        csv.writer(f).writerow(_format_row(row))
+
+
+def make_plots(rows, plots_dir):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("[sweep] matplotlib not installed, skipping plots", file=sys.stderr)
+        return
+    os.makedirs(plots_dir, exist_ok=True)
+    compressors = sorted({r["compressor"] for r in rows})
+    for metric, label in PLOT_LABELS.items():
+        plt.figure()
+        for comp in compressors:
+            pts = sorted((float(r["rel_error"]), float(r[metric])) for r in rows if r["compressor"] == comp)
+            xs, ys = zip(*pts)
+            plt.plot(xs, ys, marker="o", label=comp)
+        plt.xscale("log")
+        plt.xlabel("Relative Error")
+        plt.ylabel(label)
+        plt.title(f"{label} vs Relative Error")
+        plt.grid(True)
+        if len(compressors) > 1:
+            plt.legend()
+        plt.savefig(os.path.join(plots_dir, f"{metric}_vs_relerror.png"))
+        plt.close()
+
+
+def rel_grid(args):
+    rels = list(args.rel or [])
+    if args.rel_range:
+        lo, hi, n = args.rel_range
+        rels.extend(float(v) for v in np.logspace(np.log10(float(lo)), np.log10(float(hi)), int(n)))
+    return sorted(set(rels))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel, resumable compressor x rel sweep")
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--dim", type=int, action="append", required=True)
+    parser.add_argument("--compressor", action="append", help="Compressor (repeatable, default: sz3)")
+    parser.add_argument("--rel", type=float, nargs="+", help="Explicit rel values")
+    parser.add_argument("--rel_range", nargs=3, metavar=("LO", "HI", "N"), help="N log-spaced rel values in [LO, HI]")
+    parser.add_argument("--workers", type=int, default=1, help="Concurrent evaluations")
+    parser.add_argument("--out", default="metrics_summary.csv")
+    parser.add_argument("--checkpoint", help="Checkpoint JSONL (default: <out>.checkpoint.jsonl)")
+    parser.add_argument("--plots_dir", default="metrics_plots")
+    parser.add_argument("--no_plots", action="store_true")
+    parser.add_argument("--pipeline", default=os.path.join(SCRIPT_DIR, "run_pressio_pipeline.py"))
+    parser.add_argument("--keep_workspaces", action="store_true", help="Keep each evaluation's .npy workspace")
+    args, extra = parser.parse_known_args()
+
+    compressors = args.compressor or ["sz3"]
+    rels = rel_grid(args)
+    if not rels:
+        parser.error("give --rel and/or --rel_range")
+    checkpoint = args.checkpoint or f"{args.out}.checkpoint.jsonl"
+    context = run_context(args.input, args.dim, extra)
+
+    done = load_checkpoint(checkpoint, context)
+    if not done and has_rows(args.out):
+        # no checkpoint rows to rebuild it from: an older table, keep it instead of truncating it
+        print(f"[sweep] {args.out} exists without checkpoint rows, moved to {backup(args.out)}", file=sys.stderr)
+    # CSV is derived from the checkpoint, so a crash between the two writes cannot duplicate rows
+    write_summary(args.out, done.values())
+    todo = [(c, r) for c in compressors for r in rels if point_key(c, r) not in done]
+    print(f"[sweep] {len(compressors) * len(rels)} points, {len(done)} already done, {len(todo)} to run", file=sys.stderr)
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {pool.submit(evaluate_point, c, r, args.input, args.dim, args.pipeline, extra,
+                               args.keep_workspaces): (c, r) for c, r in todo}
+        for fut in as_completed(futures):
+            c, r = futures[fut]
+            try:
+                row = fut.result()
+            except Exception as e:  # keep sweeping; failed points are retried on resume
+                failures += 1
+                print(f"[sweep] ❌ {c} rel={r}: {e}", file=sys.stderr)
+                continue
+            row["context"] = context
+            append_checkpoint(checkpoint, row)
+            append_summary(args.out, row)
+            done[point_key(c, r)] = row
+            print(f"[sweep] {c} rel={r:.3e} cr={row['compression_ratio']:.3f} p99={row['p99']:.4f}", file=sys.stderr)
+
+    write_summary(args.out, done.values())
+    if done and not args.no_plots:
+        make_plots(list(done.values()), args.plots_dir)
+    print(f"[sweep] wrote {args.out} ({len(done)} rows, {failures} failed)", file=sys.stderr)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()